@@ -48,6 +48,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'rest.middleware.ConcurrencyLimitMiddleware',
+    'rest.middleware.ServerTimingMiddleware',
+    'rest.middleware.ProfilingMiddleware',
+    'rest.middleware.ReplicaRoutingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -92,6 +96,29 @@ DATABASES = {
     }
 }
 
+# Read replicas, e.g. DB_REPLICAS="replica1,replica2:5433*2" (optional :port
+# and *weight). They become replica_1, replica_2, ... with the primary's
+# credentials; rest.middleware.ReplicaRoutingMiddleware decides per request
+# whether rest.db_router.ReplicaRouter may use them.
+DATABASE_REPLICAS = {}
+for index, spec in enumerate(config("DB_REPLICAS", default="", cast=Csv()), start=1):
+    spec, _, weight = spec.partition('*')
+    host, _, port = spec.partition(':')
+    alias = f'replica_{index}'
+    DATABASES[alias] = dict(
+        DATABASES['default'],
+        HOST=host,
+        PORT=int(port) if port else DATABASES['default']['PORT'],
+        TEST={'MIRROR': 'default'},
+    )
+    DATABASE_REPLICAS[alias] = int(weight or 1)
+
+DATABASE_ROUTERS = ['rest.db_router.ReplicaRouter']
+REPLICA_STICKY_SECONDS = config("REPLICA_STICKY_SECONDS", default=5.0, cast=float)
+REPLICA_HEALTH_CHECK_INTERVAL = config("REPLICA_HEALTH_CHECK_INTERVAL", default=10.0, cast=float)
+REPLICA_MAX_LAG = config("REPLICA_MAX_LAG", default=30.0, cast=float)
+REPLICA_PIN_COOKIE = 'db_primary_until'
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -210,6 +237,22 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
+    # token buckets shared by all workers (rest.throttling); '20/s' refills
+    # 20 requests a second with bursts of up to 20. Buckets are per client
+    # address, so NUM_PROXIES below must match the deployment.
+    'DEFAULT_THROTTLE_CLASSES': [
+        'rest.throttling.IPThrottle',
+        'rest.throttling.RouteThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'ip': config("THROTTLE_RATE_IP", default="20/s"),
+        'PageViewSet.list': config("THROTTLE_RATE_PAGE_LIST", default="5/s"),
+        'PageViewSet.retrieve': config("THROTTLE_RATE_PAGE_DETAIL", default="5/s"),
+        'ContentViewSet.list': config("THROTTLE_RATE_CONTENT_LIST", default="10/s"),
+    },
+    # Reverse proxies in front of the app (nginx = 1). Required: with 0 behind
+    # a proxy every client shares the proxy's address, and so one bucket.
+    'NUM_PROXIES': config("NUM_PROXIES", cast=int),
 }
 
 
@@ -244,7 +287,82 @@ CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
 
 CKEDITOR_5_UPLOAD_PATH = "uploads/"
+CKEDITOR_5_FILE_STORAGE = 'rest.storage.CKEditorUploadStorage'
+
+# Media is stored once per distinct content (rest.storage). Hash-named files
+# never change, so the web server can send them with
+# "Cache-Control: public, max-age=31536000, immutable" (rest.views.serve_media
+# does in DEBUG). manage.py sweep_media deletes unreferenced files.
+STORAGES = {
+    'default': {'BACKEND': 'rest.storage.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+MEDIA_SWEEP_GRACE_HOURS = config("MEDIA_SWEEP_GRACE_HOURS", default=24, cast=float)
 
 
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+
+
+# Performance instrumentation (rest.middleware.ServerTimingMiddleware)
+# Each worker flushes its histograms into METRICS_DIR; /metrics merges them and
+# folds the files of exited workers into one. Keep it local to the host.
+VAR_DIR = BASE_DIR / 'var'
+METRICS_DIR = config("METRICS_DIR", default=str(VAR_DIR / 'metrics'))
+METRICS_FLUSH_INTERVAL = config("METRICS_FLUSH_INTERVAL", default=1.0, cast=float)
+# /metrics is open to staff, to REMOTE_ADDRs listed here and to requests with
+# "Authorization: Bearer <METRICS_TOKEN>". Empty by default: behind a local
+# reverse proxy every client's REMOTE_ADDR is loopback.
+METRICS_ALLOWED_IPS = config("METRICS_ALLOWED_IPS", default="", cast=Csv())
+METRICS_TOKEN = config("METRICS_TOKEN", default="")
+
+# On-demand profiling (rest.middleware.ProfilingMiddleware, rules in the admin)
+PROFILE_CAPTURE_DIR = config("PROFILE_CAPTURE_DIR", default=str(VAR_DIR / 'profiles'))
+PROFILE_CAPTURE_LIMIT = config("PROFILE_CAPTURE_LIMIT", default=50, cast=int)
+PROFILE_SAMPLE_INTERVAL = config("PROFILE_SAMPLE_INTERVAL", default=0.005, cast=float)
+PROFILE_RULE_TTL = config("PROFILE_RULE_TTL", default=5.0, cast=float)
+
+# Admin changelists (rest.admin_performance.PerformanceModeMixin)
+ADMIN_PERFORMANCE_MODE = config("ADMIN_PERFORMANCE_MODE", default=True, cast=bool)
+ADMIN_ESTIMATED_COUNT_THRESHOLD = config("ADMIN_ESTIMATED_COUNT_THRESHOLD", default=10000, cast=int)
+
+# Tag filters (rest.views.filter_by_tags): above this many matching contents,
+# filter with a subquery on the M2M table instead of an id list
+TAG_FILTER_MAX_IDS = config("TAG_FILTER_MAX_IDS", default=1000, cast=int)
+
+# Background jobs (rest.jobs, worker: manage.py run_jobs)
+JOB_WORKER_CONCURRENCY = config("JOB_WORKER_CONCURRENCY", default=4, cast=int)
+JOB_POLL_INTERVAL = config("JOB_POLL_INTERVAL", default=1.0, cast=float)
+JOB_VISIBILITY_TIMEOUT = config("JOB_VISIBILITY_TIMEOUT", default=300, cast=int)
+JOB_RETRY_BACKOFF = config("JOB_RETRY_BACKOFF", default=10, cast=int)
+JOB_RETRY_BACKOFF_MAX = config("JOB_RETRY_BACKOFF_MAX", default=3600, cast=int)
+
+# OpenAPI document (rest.schema). Generated by manage.py generate_openapi at
+# build time; OPENAPI_DYNAMIC regenerates it with drf-yasg on every request.
+OPENAPI_SCHEMA_DIR = config("OPENAPI_SCHEMA_DIR", default=str(BASE_DIR / 'openapi'))
+OPENAPI_DYNAMIC = config("OPENAPI_DYNAMIC", default=False, cast=bool)
+
+# Rate limiting (rest.throttling). Buckets and the in-flight count are
+# memory-mapped files shared by the workers on one host.
+THROTTLE_STATE_DIR = config("THROTTLE_STATE_DIR", default=str(VAR_DIR / 'throttle'))
+THROTTLE_SLOTS = config("THROTTLE_SLOTS", default=16384, cast=int)
+# rest.middleware.ConcurrencyLimitMiddleware: 503 once the adaptive limit is reached
+CONCURRENCY_LIMIT_PATHS = config("CONCURRENCY_LIMIT_PATHS", default="/api/", cast=Csv())
+CONCURRENCY_TARGET_LATENCY = config("CONCURRENCY_TARGET_LATENCY", default=0.5, cast=float)
+CONCURRENCY_MIN_LIMIT = config("CONCURRENCY_MIN_LIMIT", default=4, cast=int)
+CONCURRENCY_MAX_LIMIT = config("CONCURRENCY_MAX_LIMIT", default=64, cast=int)
+CONCURRENCY_BACKOFF = config("CONCURRENCY_BACKOFF", default=0.9, cast=float)
+CONCURRENCY_STALE_SECONDS = config("CONCURRENCY_STALE_SECONDS", default=60, cast=int)
+
+# Page subtree lookups (rest.tree): 'cte' (recursive CTE) or 'path' (stored
+# ancestor path; run manage.py rebuild_page_paths first)
+PAGE_SUBTREE_STRATEGY = config("PAGE_SUBTREE_STRATEGY", default="cte")
+
+# Related contents (rest.related): top-K by shared tags, halved in weight
+# every RELATED_CONTENT_HALF_LIFE_DAYS of age. Changing either needs
+# manage.py build_related_content.
+RELATED_CONTENT_TOP_K = config("RELATED_CONTENT_TOP_K", default=10, cast=int)
+RELATED_CONTENT_HALF_LIFE_DAYS = config("RELATED_CONTENT_HALF_LIFE_DAYS", default=180, cast=float)
+# A tag added to or removed from more contents than this at once queues one
+# full rebuild instead of an incremental update.
+RELATED_CONTENT_BULK_LIMIT = config("RELATED_CONTENT_BULK_LIMIT", default=200, cast=int)
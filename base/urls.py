@@ -2,29 +2,15 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
-from rest_framework import permissions
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
-
-schema_view = get_schema_view(
-    openapi.Info(
-        title="College Website API",
-        default_version='v1',
-        description="API for college news management",
-        terms_of_service="https://www.example.com/terms/",
-        contact=openapi.Contact(email="contact@college.example"),
-        license=openapi.License(name="MIT License"),
-    ),
-    public=True,
-    permission_classes=(permissions.AllowAny,),
-)
+from rest.schema import schema_json, swagger_ui, redoc_ui
+from rest.views import metrics_view, serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('rest.urls')),
-    path('swagger/', schema_view.with_ui('swagger',
-         cache_timeout=0), name='schema-swagger-ui'),
-    path('redoc/', schema_view.with_ui('redoc',
-         cache_timeout=0), name='schema-redoc'),
+    path('swagger.json', schema_json, name='schema-json'),
+    path('swagger/', swagger_ui, name='schema-swagger-ui'),
+    path('redoc/', redoc_ui, name='schema-redoc'),
     path('ckeditor5/', include('django_ckeditor_5.urls')),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    path('metrics', metrics_view, name='metrics'),
+] + static(settings.MEDIA_URL, view=serve_media, document_root=settings.MEDIA_ROOT)
@@ -1,7 +1,16 @@
+import io
+import pstats
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.db import IntegrityError, transaction
+from django.http import FileResponse, Http404
+from django.template.response import TemplateResponse
+from django.utils import timezone
 from django.utils.html import format_html
-from django.urls import reverse
-from .models import Page, Tag, Content, ContentImage, ContentText, VideoUrl
+from django.urls import path, reverse
+from .models import Page, Tag, Content, ContentImage, ContentText, VideoUrl, ProfilingRule, Job, MediaBlob
+from .profiling import captures
+from .admin_performance import AutocompleteFilter, PerformanceModeMixin
 from django.forms import Textarea
 
 # Inline for Content within Page
@@ -83,9 +92,12 @@ class TagAdmin(admin.ModelAdmin):
 
 
 @admin.register(Content)
-class ContentAdmin(admin.ModelAdmin):
+class ContentAdmin(PerformanceModeMixin, admin.ModelAdmin):
     list_display = ['title', 'slug', 'page_link', 'tags_list']
     list_filter = ['page', 'tags']
+    performance_select_related = ['page']
+    performance_prefetch_related = ['tags']
+    performance_list_filter = [('page', AutocompleteFilter), ('tags', AutocompleteFilter)]
     search_fields = ['title']
     prepopulated_fields = {'slug': ('title',)}
     raw_id_fields = ['page']
@@ -116,11 +128,13 @@ class ContentAdmin(admin.ModelAdmin):
 
 
 @admin.register(ContentImage)
-class ContentImageAdmin(admin.ModelAdmin):
+class ContentImageAdmin(PerformanceModeMixin, admin.ModelAdmin):
     list_display = ['content', 'image_preview', 'text', 'order']
     list_filter = ['content']
     search_fields = ['text']
     raw_id_fields = ['content']
+    performance_select_related = ['content']
+    performance_list_filter = [('content', AutocompleteFilter)]
     list_per_page = 25
 
     def image_preview(self, obj):
@@ -134,11 +148,13 @@ class ContentImageAdmin(admin.ModelAdmin):
 
 
 @admin.register(ContentText)
-class ContentTextAdmin(admin.ModelAdmin):
+class ContentTextAdmin(PerformanceModeMixin, admin.ModelAdmin):
     list_display = ['content', 'text_preview', 'order']
     list_filter = ['content']
     search_fields = ['text']
     raw_id_fields = ['content']
+    performance_select_related = ['content']
+    performance_list_filter = [('content', AutocompleteFilter)]
     list_per_page = 25
 
     def text_preview(self, obj):
@@ -158,3 +174,115 @@ class VideoUrlAdmin(admin.ModelAdmin):
             return f"External URL: {obj.url}"
         return "No video source"
     video_source_display.short_description = 'Video Source'
+
+
+@admin.register(ProfilingRule)
+class ProfilingRuleAdmin(admin.ModelAdmin):
+    list_display = ['route', 'mode', 'sample_rate',
+                    'threshold_ms', 'is_enabled', 'created_at']
+    list_editable = ['is_enabled']
+    list_filter = ['mode', 'is_enabled']
+    search_fields = ['route']
+    change_list_template = 'admin/rest/profilingrule/change_list.html'
+
+    def get_urls(self):
+        def view(func):
+            def wrapper(request, *args, **kwargs):
+                if not self.has_view_permission(request):
+                    raise PermissionDenied
+                return func(request, *args, **kwargs)
+            return self.admin_site.admin_view(wrapper)
+
+        return [
+            path('captures/', view(self.captures_view),
+                 name='rest_profilingrule_captures'),
+            path('captures/<str:capture_id>/', view(self.capture_detail_view),
+                 name='rest_profilingrule_capture'),
+            path('captures/<str:capture_id>/<str:kind>/', view(self.capture_download_view),
+                 name='rest_profilingrule_capture_download'),
+        ] + super().get_urls()
+
+    def captures_view(self, request):
+        context = dict(
+            self.admin_site.each_context(request),
+            opts=self.model._meta,
+            title='Slow request captures',
+            captures=captures.all(),
+        )
+        return TemplateResponse(request, 'admin/rest/profilingrule/captures.html', context)
+
+    def capture_detail_view(self, request, capture_id):
+        capture = captures.get(capture_id)
+        if capture is None:
+            raise Http404
+        stats = None
+        pstats_path = captures.artifact_path(capture_id, 'pstats')
+        if pstats_path:
+            stream = io.StringIO()
+            pstats.Stats(pstats_path, stream=stream).sort_stats('cumulative').print_stats(40)
+            stats = stream.getvalue()
+        context = dict(
+            self.admin_site.each_context(request),
+            opts=self.model._meta,
+            title=f"{capture['method']} {capture['path']}",
+            capture=capture,
+            stats=stats,
+        )
+        return TemplateResponse(request, 'admin/rest/profilingrule/capture_detail.html', context)
+
+    def capture_download_view(self, request, capture_id, kind):
+        artifact = captures.artifact_path(capture_id, kind)
+        if artifact is None:
+            raise Http404
+        return FileResponse(open(artifact, 'rb'), as_attachment=True,
+                            filename=f"{capture_id}.{kind}")
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'status', 'priority', 'attempts',
+                    'run_at', 'locked_by', 'finished_at', 'error_preview']
+    list_filter = ['status', 'name']
+    search_fields = ['name', 'dedupe_key']
+    readonly_fields = ['name', 'args', 'dedupe_key', 'attempts', 'locked_until',
+                       'locked_by', 'last_error', 'created_at', 'finished_at']
+    ordering = ['-id']
+    list_per_page = 50
+    actions = ['retry_jobs']
+
+    def has_add_permission(self, request):
+        return False
+
+    def error_preview(self, obj):
+        lines = obj.last_error.strip().splitlines()
+        return lines[-1][:80] if lines else ''
+    error_preview.short_description = 'Last error'
+
+    def retry_jobs(self, request, queryset):
+        count = skipped = 0
+        for job_id in queryset.exclude(status='running').values_list('id', flat=True):
+            try:
+                with transaction.atomic():
+                    count += Job.objects.filter(pk=job_id).update(
+                        status='queued', attempts=0, run_at=timezone.now(),
+                        locked_by='', locked_until=None, finished_at=None)
+            except IntegrityError:
+                # a job with the same dedupe_key is already queued
+                skipped += 1
+        message = f"{count} job(s) queued again."
+        if skipped:
+            message += f" {skipped} skipped: an identical job is already queued."
+        self.message_user(request, message)
+    retry_jobs.short_description = "Retry selected jobs"
+
+
+@admin.register(MediaBlob)
+class MediaBlobAdmin(admin.ModelAdmin):
+    list_display = ['name', 'size', 'refcount', 'created_at', 'referenced_at']
+    search_fields = ['name', 'sha256']
+    readonly_fields = ['sha256', 'name', 'size', 'refcount', 'created_at', 'referenced_at']
+    ordering = ['-created_at']
+    list_per_page = 50
+
+    def has_add_permission(self, request):
+        return False
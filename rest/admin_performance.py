@@ -0,0 +1,142 @@
+# rest/admin_performance.py
+from django import forms
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+class AutocompleteFilter(admin.FieldListFilter):
+    """
+    Sidebar filter for a relation that renders an admin autocomplete box
+    instead of one link per related row.
+
+    The related model's admin must define ``search_fields``.
+    """
+    template = 'admin/rest/autocomplete_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.lookup_kwarg = f'{field_path}__{field.target_field.name}__exact'
+        super().__init__(field, request, params, model, model_admin, field_path)
+        related = field.remote_field.model
+        choice_field = forms.ModelChoiceField(
+            queryset=related._default_manager.all(),
+            widget=AutocompleteSelect(field, model_admin.admin_site),
+            required=False,
+        )
+        self.widget = choice_field.widget
+
+    @property
+    def lookup_val(self):
+        value = self.used_parameters.get(self.lookup_kwarg)
+        if isinstance(value, list):
+            value = value[-1] if value else None
+        return value
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    def get_facet_counts(self, pk_attname, filtered_qs):
+        return {}
+
+    def rendered_widget(self):
+        return self.widget.render(
+            self.lookup_kwarg, self.lookup_val,
+            attrs={'id': f'autocomplete-filter-{self.field_path}'})
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.lookup_val is None,
+            'query_string': changelist.get_query_string(remove=[self.lookup_kwarg]),
+            'display': 'All',
+        }
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Uses Postgres' ``pg_class.reltuples`` for unfiltered changelists on large
+    tables instead of ``COUNT(*)``; filtered querysets still get exact counts.
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where and not query.distinct:
+            estimate = self.estimated_count()
+            if estimate is not None and estimate >= settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+    def estimated_count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        # reltuples is -1 for tables that have never been analyzed
+        if row is None or row[0] < 0:
+            return None
+        return row[0]
+
+
+class PerformanceChangeList(ChangeList):
+    def get_queryset(self, request, exclude_parameters=None):
+        queryset = super().get_queryset(request, exclude_parameters)
+        prefetch = self.model_admin.performance_prefetch_related
+        return queryset.prefetch_related(*prefetch) if prefetch else queryset
+
+
+class PerformanceModeMixin:
+    """
+    Changelist tuning enabled by ``ADMIN_PERFORMANCE_MODE``: joins/prefetches
+    for the columns in ``list_display``, autocomplete sidebar filters and
+    estimated row counts.
+    """
+    performance_select_related = ()
+    performance_prefetch_related = ()
+    performance_list_filter = None
+
+    @property
+    def performance_mode(self):
+        return settings.ADMIN_PERFORMANCE_MODE
+
+    @property
+    def show_full_result_count(self):
+        # the "N total" link next to search results is a second COUNT(*)
+        return not self.performance_mode
+
+    @property
+    def media(self):
+        media = super().media
+        if self.performance_mode and self.performance_list_filter:
+            media += AutocompleteSelect(None, self.admin_site).media
+            media += forms.Media(js=['admin/js/autocomplete_filter.js'])
+        return media
+
+    def get_changelist(self, request, **kwargs):
+        if self.performance_mode:
+            return PerformanceChangeList
+        return super().get_changelist(request, **kwargs)
+
+    def get_list_select_related(self, request):
+        if self.performance_mode and self.performance_select_related:
+            return list(self.performance_select_related)
+        return super().get_list_select_related(request)
+
+    def get_list_filter(self, request):
+        if self.performance_mode and self.performance_list_filter is not None:
+            return self.performance_list_filter
+        return super().get_list_filter(request)
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        if self.performance_mode:
+            return EstimatedCountPaginator(queryset, per_page, orphans, allow_empty_first_page)
+        return super().get_paginator(request, queryset, per_page, orphans, allow_empty_first_page)
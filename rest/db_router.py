@@ -0,0 +1,127 @@
+# rest/db_router.py
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+PRIMARY = 'default'
+# Session rows are written on login and read right after; never read them stale
+PRIMARY_ONLY_APPS = {'sessions'}
+
+LAG_SQL = (
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+class RoutingState:
+    def __init__(self, eligible):
+        # eligible: safe method and the client isn't pinned to the primary
+        self.eligible = eligible
+        self.use_replica = False
+        self.wrote = False
+        self.alias = None
+
+
+_state = ContextVar('replica_routing', default=None)
+
+
+def begin(eligible):
+    state = RoutingState(eligible)
+    return state, _state.set(state)
+
+
+def end(token):
+    _state.reset(token)
+
+
+def current():
+    return _state.get()
+
+
+class ReplicaPool:
+    """
+    Smooth weighted round-robin over ``DATABASE_REPLICAS`` (alias -> weight),
+    skipping replicas whose last health check failed or lagged too far behind.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._current = {}
+        self._health = {}
+
+    def choose(self):
+        candidates = [(alias, weight) for alias, weight in settings.DATABASE_REPLICAS.items()
+                      if weight > 0 and self.is_healthy(alias)]
+        if not candidates:
+            return None
+        with self._lock:
+            total = 0
+            best = None
+            for alias, weight in candidates:
+                self._current[alias] = self._current.get(alias, 0) + weight
+                total += weight
+                if best is None or self._current[alias] > self._current[best]:
+                    best = alias
+            self._current[best] -= total
+        return best
+
+    def is_healthy(self, alias):
+        now = time.monotonic()
+        with self._lock:
+            healthy, checked_at = self._health.get(alias, (True, None))
+            due = checked_at is None or now - checked_at >= settings.REPLICA_HEALTH_CHECK_INTERVAL
+            if due:
+                # claim the check so concurrent requests keep the old verdict
+                self._health[alias] = (healthy, now)
+        if due:
+            healthy = self.check(alias)
+            with self._lock:
+                self._health[alias] = (healthy, now)
+        return healthy
+
+    def check(self, alias):
+        connection = connections[alias]
+        try:
+            connection.ensure_connection()
+            if connection.vendor == 'postgresql' and settings.REPLICA_MAX_LAG:
+                with connection.cursor() as cursor:
+                    cursor.execute(LAG_SQL)
+                    lag = cursor.fetchone()[0]
+                return lag is None or lag <= settings.REPLICA_MAX_LAG
+        except DatabaseError:
+            return False
+        return True
+
+
+pool = ReplicaPool()
+
+
+class ReplicaRouter:
+    """
+    Sends reads to a replica while ReplicaRoutingMiddleware has marked the
+    request as a safe API read; everything else, and any read after a write in
+    the same request, uses the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.use_replica or state.wrote \
+                or model._meta.app_label in PRIMARY_ONLY_APPS:
+            return PRIMARY
+        if state.alias is None:
+            # stay on one replica for the whole request
+            state.alias = pool.choose() or PRIMARY
+        return state.alias
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same data as the primary
+        return True
@@ -0,0 +1,121 @@
+# rest/images.py
+"""
+Pillow-only image metadata helpers. Nothing here touches Django, so the
+functions can run in spawned worker processes (see backfill_image_metadata).
+"""
+import io
+import math
+import os
+
+from PIL import Image, ImageOps
+
+BASE83 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+SRGB_TO_LINEAR = [
+    v / 12.92 if v <= 0.04045 else ((v + 0.055) / 1.055) ** 2.4
+    for v in (i / 255 for i in range(256))
+]
+
+
+def _base83(value, length):
+    return ''.join(BASE83[value // 83 ** (length - i - 1) % 83] for i in range(length))
+
+
+def _linear_to_srgb(value):
+    value = max(0.0, min(1.0, value))
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def blurhash(image, x_components=4, y_components=3):
+    """Encode an RGB image as a BlurHash string (https://blurha.sh)."""
+    image = image.copy()
+    image.thumbnail((32, 32))
+    width, height = image.size
+    pixels = [tuple(SRGB_TO_LINEAR[c] for c in pixel) for pixel in image.getdata()]
+    cos_x = [[math.cos(math.pi * i * x / width) for x in range(width)] for i in range(x_components)]
+    cos_y = [[math.cos(math.pi * j * y / height) for y in range(height)] for j in range(y_components)]
+
+    factors = []
+    for j in range(y_components):
+        for i in range(x_components):
+            norm = 1 if i == j == 0 else 2
+            r = g = b = 0.0
+            for y in range(height):
+                row = y * width
+                wy = cos_y[j][y]
+                for x in range(width):
+                    basis = cos_x[i][x] * wy
+                    pr, pg, pb = pixels[row + x]
+                    r += basis * pr
+                    g += basis * pg
+                    b += basis * pb
+            scale = norm / (width * height)
+            factors.append((r * scale, g * scale, b * scale))
+
+    dc, ac = factors[0], factors[1:]
+    result = _base83(x_components - 1 + (y_components - 1) * 9, 1)
+    if ac:
+        quantised = max(0, min(82, math.floor(max(abs(v) for f in ac for v in f) * 166 - 0.5)))
+        max_value = (quantised + 1) / 166
+    else:
+        quantised, max_value = 0, 1
+    result += _base83(quantised, 1)
+    result += _base83((_linear_to_srgb(dc[0]) << 16) + (_linear_to_srgb(dc[1]) << 8)
+                      + _linear_to_srgb(dc[2]), 4)
+
+    def quant(value):
+        scaled = math.copysign(abs(value / max_value) ** 0.5, value)
+        return max(0, min(18, math.floor(scaled * 9 + 9.5)))
+
+    for r, g, b in ac:
+        result += _base83(quant(r) * 19 * 19 + quant(g) * 19 + quant(b), 2)
+    return result
+
+
+def dominant_color(image):
+    """Most common colour of a 5-colour median-cut palette, as ``#rrggbb``."""
+    small = image.copy()
+    small.thumbnail((64, 64))
+    quantized = small.quantize(colors=5, method=Image.Quantize.MEDIANCUT)
+    palette = quantized.getpalette()
+    _, index = max(quantized.getcolors())
+    return '#{:02x}{:02x}{:02x}'.format(*palette[index * 3:index * 3 + 3])
+
+
+def extract_metadata(source):
+    """
+    Width, height, byte size, BlurHash placeholder and dominant colour for an
+    image given as a path or a binary file object.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        byte_size = os.path.getsize(source)
+    else:
+        source.seek(0, os.SEEK_END)
+        byte_size = source.tell()
+        source.seek(0)
+    with Image.open(source) as picture:
+        # width/height as displayed, i.e. after EXIF rotation
+        picture = ImageOps.exif_transpose(picture)
+        width, height = picture.size
+        if picture.mode != 'RGB':
+            picture = picture.convert('RGBA').convert('RGB')
+        return {
+            'width': width,
+            'height': height,
+            'byte_size': byte_size,
+            'placeholder': blurhash(picture),
+            'dominant_color': dominant_color(picture),
+        }
+
+
+def extract_metadata_task(image_id, source):
+    """
+    Process-pool entry point: ``source`` is a path or the file's bytes. Returns
+    ``(image_id, metadata, error)`` instead of raising.
+    """
+    try:
+        metadata = extract_metadata(io.BytesIO(source) if isinstance(source, bytes) else source)
+    except Exception as exc:
+        return image_id, None, f"{type(exc).__name__}: {exc}"
+    return image_id, metadata, None
@@ -0,0 +1,155 @@
+# rest/jobs.py
+import logging
+import os
+import random
+import socket
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+def task(func=None, *, priority=0, max_attempts=3, timeout=None):
+    """
+    Register ``func`` as a background job. ``func.enqueue(*args, ...)`` adds it
+    to the queue; the arguments must be JSON-serialisable.
+    """
+    def decorator(func):
+        name = f"{func.__module__}.{func.__qualname__}"
+        func.job_name = name
+        func.job_options = {'priority': priority, 'max_attempts': max_attempts,
+                            'timeout': timeout}
+        func.enqueue = lambda *args, **options: enqueue(func, args, **options)
+        _registry[name] = func
+        return func
+
+    return decorator(func) if func is not None else decorator
+
+
+def enqueue(func, args=(), priority=None, dedupe_key=None, delay=0, max_attempts=None):
+    """
+    Queue ``func(*args)``. With ``dedupe_key``, an identical key that is still
+    queued is returned instead of adding a second job (a partial unique
+    constraint backs this up against concurrent enqueues).
+    """
+    from .models import Job
+
+    options = func.job_options
+    while True:
+        if dedupe_key:
+            existing = Job.objects.filter(dedupe_key=dedupe_key, status='queued').first()
+            if existing is not None:
+                return existing
+        try:
+            with transaction.atomic():
+                return Job.objects.create(
+                    name=func.job_name,
+                    args=list(args),
+                    priority=options['priority'] if priority is None else priority,
+                    max_attempts=options['max_attempts'] if max_attempts is None else max_attempts,
+                    dedupe_key=dedupe_key,
+                    run_at=timezone.now() + timedelta(seconds=delay),
+                )
+        except IntegrityError:
+            if not dedupe_key:
+                raise
+            # a concurrent enqueue of the same key won; return its job
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim(worker, limit):
+    """
+    Lock up to ``limit`` runnable jobs for ``worker``: queued jobs that are due,
+    and running jobs whose visibility timeout expired (their worker died).
+    Each claim is a conditional UPDATE, so concurrent workers never share a job.
+    Expired jobs that have used all their attempts are marked failed instead.
+    """
+    from .models import Job
+
+    now = timezone.now()
+    expired = Q(status='running', locked_until__lt=now)
+    Job.objects.filter(expired, attempts__gte=F('max_attempts')).update(
+        status='failed', locked_until=None, finished_at=now,
+        last_error='Visibility timeout expired on the last attempt')
+    runnable = Q(status='queued', run_at__lte=now) | (expired & Q(attempts__lt=F('max_attempts')))
+    candidates = (Job.objects.filter(runnable)
+                  .order_by('-priority', 'run_at', 'id')
+                  .values_list('id', 'name')[:limit * 2])
+    claimed = []
+    for job_id, name in candidates:
+        if len(claimed) == limit:
+            break
+        func = _registry.get(name)
+        timeout = (func.job_options['timeout'] if func else None) or settings.JOB_VISIBILITY_TIMEOUT
+        updated = Job.objects.filter(Q(pk=job_id) & runnable).update(
+            status='running',
+            locked_by=worker,
+            locked_until=now + timedelta(seconds=timeout),
+            attempts=F('attempts') + 1,
+        )
+        if updated:
+            claimed.append(job_id)
+    return claimed
+
+
+def backoff(attempt):
+    """Exponential backoff with jitter, capped at JOB_RETRY_BACKOFF_MAX seconds."""
+    delay = min(settings.JOB_RETRY_BACKOFF * 2 ** (attempt - 1), settings.JOB_RETRY_BACKOFF_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def run_job(job_id, worker):
+    """Execute a claimed job and record the outcome (runs in a pool worker)."""
+    from .models import Job
+
+    close_old_connections()
+    try:
+        job = Job.objects.get(pk=job_id, locked_by=worker, status='running')
+    except Job.DoesNotExist:
+        return None
+    owned = Job.objects.filter(pk=job.pk, locked_by=worker,
+                               attempts=job.attempts, status='running')
+    try:
+        func = _registry.get(job.name)
+        if func is None:
+            raise LookupError(f"Unknown job {job.name!r}")
+        func(*job.args)
+    except Exception:
+        logger.warning("Job %s (%s) failed, attempt %s/%s",
+                       job.pk, job.name, job.attempts, job.max_attempts)
+        error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            try:
+                with transaction.atomic():
+                    owned.update(status='queued', locked_by='', locked_until=None, last_error=error,
+                                 run_at=timezone.now() + timedelta(seconds=backoff(job.attempts)))
+            except IntegrityError:
+                # the same dedupe_key was queued again meanwhile; that job retries
+                owned.update(status='failed', locked_until=None, last_error=error,
+                             finished_at=timezone.now())
+        else:
+            owned.update(status='failed', locked_until=None, last_error=error,
+                         finished_at=timezone.now())
+        succeeded = False
+    else:
+        owned.update(status='done', locked_until=None, finished_at=timezone.now())
+        succeeded = True
+    finally:
+        close_old_connections()
+    return succeeded
+
+
+def init_worker_process():
+    # ProcessPoolExecutor initializer for spawned worker processes
+    import django
+    django.setup()
@@ -0,0 +1,76 @@
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from rest.images import extract_metadata_task
+from rest.models import ContentImage
+
+
+class Command(BaseCommand):
+    help = 'Compute width, height, size, BlurHash and dominant colour for existing ContentImage files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Size of the process pool')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Images handed to the pool between checkpoints')
+        parser.add_argument('--all', action='store_true',
+                            help='Recompute images that already have metadata')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore the checkpoint left by an interrupted --all run')
+
+    def handle(self, *args, **options):
+        checkpoint_path = os.path.join(str(settings.VAR_DIR), 'image_backfill.json')
+        last_id = 0
+        if options['all'] and not options['restart'] and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as fh:
+                last_id = json.load(fh)['last_id']
+            self.stdout.write(f"Resuming after ContentImage {last_id}")
+
+        queryset = ContentImage.objects.exclude(image='').order_by('id')
+        if not options['all']:
+            # rows that already have a placeholder are done, so this resumes by itself
+            queryset = queryset.filter(placeholder='')
+        storage = ContentImage._meta.get_field('image').storage
+
+        done = failed = 0
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(options['workers'], mp_context=context) as executor:
+            while True:
+                batch = list(queryset.filter(id__gt=last_id)
+                             .values_list('id', 'image')[:options['batch_size']])
+                if not batch:
+                    break
+                futures = [executor.submit(extract_metadata_task, image_id, self.source(storage, name))
+                           for image_id, name in batch]
+                for future in futures:
+                    image_id, metadata, error = future.result()
+                    if metadata is None:
+                        failed += 1
+                        self.stderr.write(f"ContentImage {image_id}: {error}")
+                    else:
+                        ContentImage.objects.filter(pk=image_id).update(**metadata)
+                        done += 1
+                last_id = batch[-1][0]
+                if options['all']:
+                    os.makedirs(os.path.dirname(checkpoint_path), exist_ok=True)
+                    with open(checkpoint_path, 'w') as fh:
+                        json.dump({'last_id': last_id}, fh)
+                self.stdout.write(f"{done} done, {failed} failed (up to id {last_id})")
+
+        if options['all'] and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        self.stdout.write(self.style.SUCCESS(f"Finished: {done} updated, {failed} failed"))
+
+    @staticmethod
+    def source(storage, name):
+        try:
+            return storage.path(name)
+        except NotImplementedError:
+            # remote storage: read here and ship the bytes to the worker
+            with storage.open(name, 'rb') as fh:
+                return fh.read()
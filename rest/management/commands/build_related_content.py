@@ -0,0 +1,20 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from rest import related
+
+
+class Command(BaseCommand):
+    help = 'Recompute the related-content table for every Content'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=settings.RELATED_CONTENT_TOP_K,
+                            help='Related contents kept per content')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        contents, rows = related.rebuild(options['top_k'])
+        self.stdout.write(f"{rows} related entries for {contents} contents "
+                          f"in {time.perf_counter() - started:.2f}s")
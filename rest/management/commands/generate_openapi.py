@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from rest.schema import generate_schema, write_schema
+
+
+class Command(BaseCommand):
+    help = 'Generate the OpenAPI document served at /swagger/ and /redoc/ (run at build time)'
+
+    def handle(self, *args, **options):
+        path = write_schema(generate_schema())
+        self.stdout.write(self.style.SUCCESS(f"Wrote {path}"))
@@ -0,0 +1,416 @@
+import http.client
+import itertools
+import json
+import math
+import os
+import random
+import re
+import shlex
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from importlib.util import find_spec
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from rest.management.commands.warm_cache import LOG_REQUEST_RE, percentile
+from rest.models import Content, Page, Tag
+
+SYNTHETIC_MIX = {
+    'navigation': 25,
+    'page_detail': 25,
+    'content_list': 25,
+    'carousel': 15,
+    'search': 10,
+}
+# request kinds of recorded URLs, first match wins
+KIND_PATTERNS = [
+    ('search', re.compile(r'[?&]search=')),
+    ('navigation', re.compile(r'^/api/page-navigation/')),
+    ('carousel', re.compile(r'^/api/carousel/')),
+    ('page_detail', re.compile(r'^/api/pages/[^/?]+/')),
+    ('content_list', re.compile(r'^/api/contents/(\?|$)')),
+]
+# unset rates and paths switch off rest.throttling for the server under test
+UNLIMITED_ENV = {
+    'THROTTLE_RATE_IP': '',
+    'THROTTLE_RATE_PAGE_LIST': '',
+    'THROTTLE_RATE_PAGE_DETAIL': '',
+    'THROTTLE_RATE_CONTENT_LIST': '',
+    'CONCURRENCY_LIMIT_PATHS': '',
+}
+
+
+class Command(BaseCommand):
+    help = ('Replay a recorded or synthetic mix of API requests against a locally started '
+            'server and report throughput, latency, errors and worker memory')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', choices=['wsgi', 'asgi', 'runserver'], default='wsgi',
+                            help='gunicorn on base/wsgi.py, uvicorn on base/asgi.py, or runserver')
+        parser.add_argument('--workers', type=int, default=2,
+                            help='Server worker processes (wsgi/asgi)')
+        parser.add_argument('--server-cmd',
+                            help='Start the server with this command instead; {port} is replaced')
+        parser.add_argument('--base-url',
+                            help='Load an already running server (no memory figures)')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Client connections sending requests at once')
+        parser.add_argument('--duration', type=float, default=30,
+                            help='Seconds of measured load')
+        parser.add_argument('--warmup', type=float, default=5,
+                            help='Seconds of unmeasured load before measuring')
+        parser.add_argument('--mix-file',
+                            help='Access log or file of URL paths to replay in order')
+        parser.add_argument('--seed', type=int, default=1,
+                            help='Random seed for the synthetic mix')
+        parser.add_argument('--keep-limits', action='store_true',
+                            help='Leave throttles and the concurrency limiter on')
+        parser.add_argument('--output',
+                            help='Results file (default: VAR_DIR/loadtest/<time>-<server>.json)')
+        parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'),
+                            help='Compare two results files and exit')
+
+    def handle(self, *args, **options):
+        if options['compare']:
+            return self.compare(*options['compare'])
+
+        next_url, mix_source = self.build_mix(options)
+        server = None
+        if options['base_url']:
+            base_url = options['base_url'].rstrip('/')
+        else:
+            server, base_url = self.start_server(options)
+        try:
+            self.stdout.write(f"Warming up for {options['warmup']:g}s against {base_url}")
+            self.run_phase(base_url, next_url, options['concurrency'], options['warmup'], None)
+            memory = MemoryTracker(server.pid if server else None)
+            memory.start()
+            self.stdout.write(f"Measuring for {options['duration']:g}s "
+                              f"at concurrency {options['concurrency']}")
+            samples = []
+            lock = threading.Lock()
+
+            def record(sample):
+                with lock:
+                    samples.append(sample)
+
+            elapsed = self.run_phase(base_url, next_url, options['concurrency'],
+                                     options['duration'], record)
+            memory.stop()
+        finally:
+            if server is not None:
+                server.terminate()
+                try:
+                    server.wait(10)
+                except subprocess.TimeoutExpired:
+                    server.kill()
+
+        results = {
+            'created_at': timezone.now().isoformat(),
+            'revision': git_revision(),
+            'server': {
+                'kind': 'external' if options['base_url'] else options['server'],
+                'command': options['server_cmd'] or (server.args if server else base_url),
+                'workers': options['workers'],
+                'limits': options['keep_limits'],
+            },
+            'load': {
+                'concurrency': options['concurrency'],
+                'duration': elapsed,
+                'warmup': options['warmup'],
+                'mix': mix_source,
+            },
+            'totals': summarize(samples, elapsed),
+            'endpoints': {kind: summarize([s for s in samples if s[0] == kind], elapsed)
+                          for kind in sorted({s[0] for s in samples})},
+            'status_codes': dict(Counter(str(s[1]) for s in samples).most_common()),
+            'memory': memory.report(),
+        }
+        self.print_report(results)
+        path = options['output'] or os.path.join(
+            str(settings.VAR_DIR), 'loadtest',
+            f"{timezone.now():%Y%m%d-%H%M%S}-{results['server']['kind']}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as fh:
+            json.dump(results, fh, indent=2)
+        self.stdout.write(f"\nSaved {path}")
+
+    def build_mix(self, options):
+        """A thread-safe ``next_url()`` returning (kind, url), and a description of the mix."""
+        if options['mix_file']:
+            urls = []
+            with open(options['mix_file'], errors='replace') as fh:
+                for line in fh:
+                    match = LOG_REQUEST_RE.search(line)
+                    url = match.group(1) if match else line.strip()
+                    if url.startswith('/'):
+                        urls.append((classify(url), url))
+            if not urls:
+                raise CommandError(f"No requests found in {options['mix_file']}")
+            lock = threading.Lock()
+            replay = itertools.cycle(urls)
+
+            def next_url():
+                with lock:
+                    return next(replay)
+
+            return next_url, {'file': options['mix_file'], 'requests': len(urls)}
+
+        page_ids = [str(pk) for pk in Page.objects.filter(is_published=True).values_list('id', flat=True)]
+        tag_slugs = list(Tag.objects.values_list('slug', flat=True))
+        titles = list(Page.objects.values_list('title', flat=True)[:200]) + \
+            list(Content.objects.values_list('title', flat=True)[:200])
+        terms = sorted({word for title in titles for word in title.split() if len(word) > 2}) or ['a']
+        content_pages = max(1, math.ceil(Content.objects.count() / settings.REST_FRAMEWORK['PAGE_SIZE']))
+        if not page_ids:
+            raise CommandError('No published pages to request; seed the database or use --mix-file')
+
+        def content_list(rng):
+            if tag_slugs and rng.random() < 0.7:
+                # filtered lists may have a single page
+                chosen = rng.sample(tag_slugs, min(len(tag_slugs), rng.randint(1, 2)))
+                return f"/api/contents/?tags={','.join(chosen)}&tags_op={rng.choice(['and', 'or'])}"
+            return f'/api/contents/?page={rng.randint(1, min(content_pages, 3))}'
+
+        builders = {
+            'navigation': lambda rng: '/api/page-navigation/',
+            'page_detail': lambda rng: f'/api/pages/{rng.choice(page_ids)}/',
+            'content_list': content_list,
+            'carousel': lambda rng: '/api/carousel/',
+            'search': lambda rng: (f"/api/{rng.choice(['pages', 'contents'])}/"
+                                   f"?search={rng.choice(terms)}"),
+        }
+        kinds, weights = zip(*SYNTHETIC_MIX.items())
+        local = threading.local()
+        seed = itertools.count(options['seed'])
+
+        def next_url():
+            if not hasattr(local, 'rng'):
+                local.rng = random.Random(next(seed))
+            kind = local.rng.choices(kinds, weights)[0]
+            return kind, builders[kind](local.rng)
+
+        return next_url, {'synthetic': SYNTHETIC_MIX, 'seed': options['seed']}
+
+    def start_server(self, options):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        workers = str(options['workers'])
+        if options['server_cmd']:
+            command = shlex.split(options['server_cmd'].format(port=port))
+        elif options['server'] == 'wsgi':
+            command = [sys.executable, '-m', 'gunicorn', 'base.wsgi:application',
+                       '--bind', f'127.0.0.1:{port}', '--workers', workers]
+        elif options['server'] == 'asgi':
+            command = [sys.executable, '-m', 'uvicorn', 'base.asgi:application',
+                       '--host', '127.0.0.1', '--port', str(port), '--workers', workers,
+                       '--no-access-log', '--log-level', 'warning']
+        else:
+            command = [sys.executable, 'manage.py', 'runserver', '--noreload', f'127.0.0.1:{port}']
+        module = {'wsgi': 'gunicorn', 'asgi': 'uvicorn'}.get(options['server'])
+        if not options['server_cmd'] and module and find_spec(module) is None:
+            raise CommandError(f"{module} is not installed; install it or use --server runserver")
+
+        env = dict(os.environ)
+        if not options['keep_limits']:
+            env.update(UNLIMITED_ENV)
+        # keep the server's access log off the report unless asked for
+        output = None if options['verbosity'] > 1 else subprocess.DEVNULL
+        server = subprocess.Popen(command, cwd=str(settings.BASE_DIR), env=env,
+                                  stdout=output, stderr=output)
+        base_url = f'http://127.0.0.1:{port}'
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f"Server exited with status {server.returncode}: {' '.join(command)}")
+            try:
+                status = fetch(http.client.HTTPConnection('127.0.0.1', port, timeout=5),
+                               '/api/page-navigation/')[0]
+            except OSError:
+                status = None
+            if status == 200:
+                self.stdout.write(f"Started {' '.join(command)} (pid {server.pid})")
+                return server, base_url
+            time.sleep(0.2)
+        server.kill()
+        raise CommandError(f"Server did not answer within 30s: {' '.join(command)}")
+
+    def run_phase(self, base_url, next_url, concurrency, seconds, record):
+        """Closed-loop load: each connection sends its next request when the last one returns."""
+        if seconds <= 0:
+            return 0.0
+        url = urlsplit(base_url)
+        started = time.perf_counter()
+        deadline = started + seconds
+
+        def client():
+            conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+            try:
+                while time.perf_counter() < deadline:
+                    kind, path = next_url()
+                    request_started = time.perf_counter()
+                    status, size = fetch(conn, path)
+                    if record is not None:
+                        record((kind, status, (time.perf_counter() - request_started) * 1000, size))
+            finally:
+                conn.close()
+
+        with ThreadPoolExecutor(concurrency) as executor:
+            for future in [executor.submit(client) for _ in range(concurrency)]:
+                future.result()
+        return time.perf_counter() - started
+
+    def print_report(self, results):
+        self.stdout.write(f"\n{'endpoint':<14} {'req':>7} {'req/s':>8} {'err%':>6} "
+                          f"{'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}  (ms)")
+        rows = list(results['endpoints'].items()) + [('TOTAL', results['totals'])]
+        for kind, stats in rows:
+            self.stdout.write(
+                f"{kind:<14} {stats['requests']:>7} {stats['rps']:>8.1f} "
+                f"{stats['error_rate'] * 100:>6.2f} {stats['p50']:>8.1f} {stats['p90']:>8.1f} "
+                f"{stats['p99']:>8.1f} {stats['max']:>8.1f}")
+        self.stdout.write(f"status codes: {results['status_codes']}")
+        for pid, usage in results['memory'].items():
+            self.stdout.write(f"worker {pid}: {usage['start_kb'] / 1024:.1f} -> "
+                              f"{usage['end_kb'] / 1024:.1f} MiB (peak {usage['peak_kb'] / 1024:.1f}, "
+                              f"growth {usage['growth_kb'] / 1024:+.1f})")
+
+    def compare(self, before_path, after_path):
+        with open(before_path) as fh:
+            before = json.load(fh)
+        with open(after_path) as fh:
+            after = json.load(fh)
+        self.stdout.write(f"{before_path} ({before['server']['kind']}) -> "
+                          f"{after_path} ({after['server']['kind']})")
+        self.stdout.write(f"{'endpoint':<14} {'req/s':>17} {'p50 ms':>17} {'p99 ms':>17} {'err%':>13}")
+        kinds = sorted(set(before['endpoints']) | set(after['endpoints']))
+        for kind in kinds + ['TOTAL']:
+            old = before['totals'] if kind == 'TOTAL' else before['endpoints'].get(kind)
+            new = after['totals'] if kind == 'TOTAL' else after['endpoints'].get(kind)
+            if not old or not new:
+                continue
+            self.stdout.write(
+                f"{kind:<14} {old['rps']:>7.1f} -> {new['rps']:<7.1f} "
+                f"{old['p50']:>7.1f} -> {new['p50']:<7.1f} {old['p99']:>7.1f} -> {new['p99']:<7.1f} "
+                f"{old['error_rate'] * 100:>5.2f} -> {new['error_rate'] * 100:<5.2f}")
+        for label, results in (('before', before), ('after', after)):
+            growth = [usage['growth_kb'] for usage in results['memory'].values()]
+            if growth:
+                self.stdout.write(f"memory growth {label}: max {max(growth) / 1024:+.1f} MiB "
+                                  f"over {len(growth)} worker(s)")
+
+
+def classify(url):
+    for kind, pattern in KIND_PATTERNS:
+        if pattern.search(url):
+            return kind
+    return 'other'
+
+
+def fetch(conn, path):
+    """(status, body size) of a GET on a keep-alive connection; 599 on connection errors."""
+    try:
+        conn.request('GET', path, headers={'Accept': 'application/json'})
+        response = conn.getresponse()
+        return response.status, len(response.read())
+    except (OSError, http.client.HTTPException):
+        conn.close()
+        return 599, 0
+
+
+def summarize(samples, elapsed):
+    timings = sorted(sample[2] for sample in samples)
+    # a 404 or 400 is a broken URL in the mix, not a success; 429s are only
+    # expected with --keep-limits and are reported as 'throttled' instead
+    errors = sum(1 for sample in samples if sample[1] >= 400 and sample[1] != 429)
+    return {
+        'requests': len(samples),
+        'rps': len(samples) / elapsed if elapsed else 0.0,
+        'errors': errors,
+        'error_rate': errors / len(samples) if samples else 0.0,
+        'throttled': sum(1 for sample in samples if sample[1] == 429),
+        'mean': sum(timings) / len(timings) if timings else 0.0,
+        'p50': percentile(timings, 50),
+        'p90': percentile(timings, 90),
+        'p99': percentile(timings, 99),
+        'max': timings[-1] if timings else 0.0,
+        'bytes': sum(sample[3] for sample in samples),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=str(settings.BASE_DIR),
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except OSError:
+        return None
+
+
+class MemoryTracker:
+    """
+    Resident memory of the server's worker processes (its descendants, or the
+    server itself if it has none), read from /proc once a second.
+    """
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.usage = defaultdict(dict)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        if self.pid is not None and os.path.isdir('/proc'):
+            self.sample()
+            self._thread.start()
+
+    def stop(self):
+        if self._thread.is_alive():
+            self._stopped.set()
+            self._thread.join()
+            self.sample()
+
+    def _run(self):
+        while not self._stopped.wait(1.0):
+            self.sample()
+
+    def workers(self):
+        children = defaultdict(list)
+        for entry in os.listdir('/proc'):
+            if entry.isdigit():
+                try:
+                    with open(f'/proc/{entry}/stat') as fh:
+                        # the command name may contain spaces; fields resume after ')'
+                        ppid = int(fh.read().rsplit(')', 1)[1].split()[1])
+                except (OSError, IndexError, ValueError):
+                    continue
+                children[ppid].append(int(entry))
+        descendants, level = [], children[self.pid]
+        while level:
+            descendants += level
+            level = [child for pid in level for child in children[pid]]
+        return descendants or [self.pid]
+
+    def sample(self):
+        for pid in self.workers():
+            try:
+                with open(f'/proc/{pid}/status') as fh:
+                    rss = next(int(line.split()[1]) for line in fh if line.startswith('VmRSS:'))
+            except (OSError, StopIteration):
+                continue
+            usage = self.usage[pid]
+            usage.setdefault('start_kb', rss)
+            usage['end_kb'] = rss
+            usage['peak_kb'] = max(usage.get('peak_kb', 0), rss)
+
+    def report(self):
+        return {str(pid): dict(usage, growth_kb=usage['end_kb'] - usage['start_kb'])
+                for pid, usage in sorted(self.usage.items())}
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from rest.models import Page
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored ancestor path of every Page (for PAGE_SUBTREE_STRATEGY=path)'
+
+    def handle(self, *args, **options):
+        pages = list(Page.objects.only('id', 'parent_id', 'path'))
+        children = {}
+        for page in pages:
+            children.setdefault(page.parent_id, []).append(page)
+
+        changed = []
+        level = [(page, '/') for page in children.get(None, [])]
+        seen = 0
+        while level:
+            next_level = []
+            for page, parent_path in level:
+                seen += 1
+                path = f"{parent_path}{page.pk.hex}/"
+                if page.path != path:
+                    page.path = path
+                    changed.append(page)
+                next_level += [(child, path) for child in children.get(page.pk, [])]
+            level = next_level
+
+        with transaction.atomic():
+            Page.objects.bulk_update(changed, ['path'], batch_size=500)
+        self.stdout.write(f"{len(changed)} of {len(pages)} page paths updated")
+        if seen != len(pages):
+            self.stderr.write(f"{len(pages) - seen} page(s) are not reachable from a top-level page "
+                              "(parent cycle?) and were left unchanged")
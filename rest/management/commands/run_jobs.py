@@ -0,0 +1,91 @@
+import logging
+import multiprocessing
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connections
+
+from rest import jobs
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs from the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.JOB_WORKER_CONCURRENCY,
+                            help='Number of jobs run at the same time')
+        parser.add_argument('--mode', choices=['thread', 'process'], default='thread',
+                            help='Run jobs in a thread pool or a process pool')
+        parser.add_argument('--burst', action='store_true',
+                            help='Exit once the queue is empty instead of polling')
+
+    def make_executor(self, mode, concurrency):
+        if mode == 'process':
+            # spawn, so children don't inherit this process' DB connections
+            return ProcessPoolExecutor(
+                concurrency, mp_context=multiprocessing.get_context('spawn'),
+                initializer=jobs.init_worker_process)
+        return ThreadPoolExecutor(concurrency, thread_name_prefix='job')
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency']
+        worker = jobs.worker_id()
+        executor = self.make_executor(options['mode'], concurrency)
+
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.stdout.write(f"Worker {worker}: {concurrency} {options['mode']}(s)")
+
+        running = set()
+        done_count = failed_count = 0
+        try:
+            while not self.stopping:
+                free = concurrency - len(running)
+                try:
+                    claimed = jobs.claim(worker, free) if free else []
+                except DatabaseError:
+                    logger.exception("Worker %s could not claim jobs", worker)
+                    claimed = []
+                connections.close_all()
+                for job_id in claimed:
+                    try:
+                        running.add(executor.submit(jobs.run_job, job_id, worker))
+                    except BrokenProcessPool:
+                        # a child died; jobs it held come back after their visibility timeout
+                        logger.error("Worker %s: process pool broken, starting a new one", worker)
+                        executor.shutdown(wait=False)
+                        executor = self.make_executor(options['mode'], concurrency)
+                        running.add(executor.submit(jobs.run_job, job_id, worker))
+                if not running:
+                    if options['burst']:
+                        break
+                    time.sleep(settings.JOB_POLL_INTERVAL)
+                    continue
+                finished, running = wait(running, timeout=settings.JOB_POLL_INTERVAL,
+                                         return_when=FIRST_COMPLETED)
+                for future in finished:
+                    try:
+                        result = future.result()
+                    except Exception:
+                        # e.g. the database went away before the job could be loaded;
+                        # the claim expires and the job is retried
+                        logger.exception("Worker %s: job runner raised", worker)
+                        continue
+                    if result:
+                        done_count += 1
+                    elif result is False:
+                        failed_count += 1
+        finally:
+            executor.shutdown(wait=True)
+        self.stdout.write(f"Worker {worker} stopped: {done_count} done, {failed_count} failed")
+
+    def stop(self, signum, frame):
+        self.stdout.write('Finishing running jobs...')
+        self.stopping = True
@@ -0,0 +1,104 @@
+import os
+import re
+from collections import Counter
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from django.utils import timezone
+from django_ckeditor_5.fields import CKEditor5Field
+
+from rest.models import MediaBlob
+from rest.storage import ContentAddressedStorage, is_hashed_name
+
+
+class Command(BaseCommand):
+    help = 'Recount MediaBlob references and delete stored files nothing refers to'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=settings.MEDIA_SWEEP_GRACE_HOURS,
+                            help='Keep unreferenced files this long after their last use '
+                                 '(uploads whose form has not been saved yet)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would be deleted without deleting it')
+
+    def handle(self, *args, **options):
+        storage = default_storage
+        cutoff = timezone.now() - timedelta(hours=options['grace_hours'])
+        dry_run = options['dry_run']
+
+        references = self.count_references()
+        recounted = 0
+        for pk, name, refcount in MediaBlob.objects.values_list('pk', 'name', 'refcount').iterator():
+            if references[name] == refcount:
+                continue
+            if dry_run:
+                recounted += 1
+            else:
+                # only fix rows nobody touched during the scan
+                recounted += MediaBlob.objects.filter(pk=pk, refcount=refcount).update(
+                    refcount=references[name])
+
+        deleted = freed = 0
+        candidates = MediaBlob.objects.filter(refcount=0, referenced_at__lt=cutoff)
+        for pk in candidates.values_list('pk', flat=True).iterator():
+            with transaction.atomic():
+                # locking the row makes a concurrent upload of the same bytes
+                # wait, then write the file again instead of reusing it
+                blob = candidates.select_for_update().filter(pk=pk).first()
+                if blob is None:
+                    continue
+                self.stdout.write(f"{'Would delete' if dry_run else 'Deleting'} {blob.name}")
+                if not dry_run:
+                    storage.delete(blob.name)
+                    blob.delete()
+                deleted += 1
+                freed += blob.size
+
+        orphans = self.sweep_orphans(storage, cutoff.timestamp(), dry_run)
+        self.stdout.write(
+            f"{recounted} reference count(s) corrected, {deleted} blob(s) "
+            f"({freed / 1024 / 1024:.1f} MiB) and {orphans} orphaned file(s) "
+            f"{'to delete' if dry_run else 'deleted'}")
+
+    def count_references(self):
+        """Stored names in file fields plus media URLs inside CKEditor HTML."""
+        references = Counter()
+        media_url = re.compile(re.escape(settings.MEDIA_URL) + r'([^"\'\s<>?#]+)')
+        for model in apps.get_models():
+            for field in model._meta.concrete_fields:
+                values = model._default_manager.values_list(field.attname, flat=True)
+                if isinstance(field, models.FileField):
+                    if isinstance(field.storage, ContentAddressedStorage):
+                        references.update(name for name in values.exclude(**{field.attname: ''})
+                                          .exclude(**{f'{field.attname}__isnull': True}).iterator())
+                elif isinstance(field, CKEditor5Field):
+                    for html in values.filter(**{f'{field.attname}__contains': settings.MEDIA_URL}).iterator():
+                        references.update(media_url.findall(html))
+        return references
+
+    def sweep_orphans(self, storage, cutoff, dry_run):
+        """
+        Hash-named files without a MediaBlob row (the upload's transaction
+        rolled back) and temporary files left by interrupted writes.
+        """
+        known = set(MediaBlob.objects.values_list('name', flat=True))
+        root = storage.location
+        count = 0
+        for directory, _, files in os.walk(root):
+            for filename in files:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, root).replace(os.sep, '/')
+                temporary = filename.startswith('.') and filename.endswith('.tmp')
+                if not temporary and (not is_hashed_name(name) or name in known):
+                    continue
+                if os.path.getmtime(path) >= cutoff:
+                    continue
+                self.stdout.write(f"{'Would delete' if dry_run else 'Deleting'} orphan {name}")
+                if not dry_run:
+                    storage.delete(name)
+                count += 1
+        return count
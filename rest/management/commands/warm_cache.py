@@ -0,0 +1,160 @@
+import json
+import math
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from rest.models import Content, Page
+from rest.throttling import INTERNAL_REQUEST_KEY
+
+# "GET /api/pages/<id>/ HTTP/1.1" in common/combined access logs
+LOG_REQUEST_RE = re.compile(r'"GET (/api/[^ "]*) HTTP/[0-9.]+" (\d{3})')
+
+
+class Command(BaseCommand):
+    help = 'Request published pages, their contents and list endpoints to warm caches after a deploy'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4,
+                            help='Number of requests in flight at once')
+        parser.add_argument('--list-pages', type=int, default=3,
+                            help='How many pages of each list endpoint to fetch')
+        parser.add_argument('--access-log', action='append', default=[],
+                            help='Access log to rank URLs by recent hits (repeatable)')
+        parser.add_argument('--priority-file',
+                            help='File with one URL path per line, warmed first in that order')
+        parser.add_argument('--top', type=int, default=200,
+                            help='Number of most-hit URLs taken from the access logs')
+        parser.add_argument('--base-url',
+                            help='Warm a running server over HTTP instead of in-process '
+                                 '(subject to its throttles)')
+        parser.add_argument('--host',
+                            help='Host header for in-process requests (default: the first '
+                                 'non-wildcard ALLOWED_HOSTS entry)')
+        parser.add_argument('--json', action='store_true',
+                            help='Print the per-URL report as JSON')
+
+    def handle(self, *args, **options):
+        urls = self.dedupe(self.priority_urls(options) + self.crawl_urls(options['list_pages']))
+        if not urls:
+            raise CommandError('Nothing to warm')
+
+        fetch = (self.http_fetcher(options['base_url']) if options['base_url']
+                 else self.client_fetcher(options['host'] or default_host()))
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max(1, options['concurrency'])) as executor:
+            results = list(executor.map(fetch, urls))
+        elapsed = time.perf_counter() - started
+
+        if options['json']:
+            self.stdout.write(json.dumps({'elapsed': elapsed, 'results': results}, indent=2))
+            return
+        for result in results:
+            self.stdout.write(f"{result['status']} {result['ms']:9.1f} ms {result['bytes']:9d} B  {result['url']}")
+        timings = sorted(result['ms'] for result in results)
+        errors = sum(1 for result in results if result['status'] >= 400)
+        self.stdout.write(
+            f"\n{len(results)} URLs in {elapsed:.2f}s, {errors} errors, "
+            f"p50 {percentile(timings, 50):.1f} ms, p95 {percentile(timings, 95):.1f} ms, "
+            f"max {timings[-1]:.1f} ms")
+
+    def priority_urls(self, options):
+        urls = []
+        if options['priority_file']:
+            with open(options['priority_file']) as fh:
+                urls += [line.strip() for line in fh if line.strip() and not line.startswith('#')]
+        hits = Counter()
+        for log_path in options['access_log']:
+            with open(log_path, errors='replace') as fh:
+                for line in fh:
+                    match = LOG_REQUEST_RE.search(line)
+                    if match and match.group(2) == '200':
+                        hits[match.group(1)] += 1
+        urls += [url for url, _ in hits.most_common(options['top'])]
+        return urls
+
+    def crawl_urls(self, list_pages):
+        urls = ['/api/page-navigation/', '/api/carousel/', '/api/tags/', '/api/contents/facets/']
+        page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+        for endpoint, model in (('contents', Content), ('pages', Page)):
+            # don't request list pages past the end (they 404)
+            available = max(1, math.ceil(model.objects.count() / page_size))
+            urls += [f'/api/{endpoint}/?page={number}'
+                     for number in range(1, min(list_pages, available) + 1)]
+        # walk the published tree from the top-level pages down
+        pages = Page.objects.filter(is_published=True).values_list('id', 'parent_id')
+        children = {}
+        for page_id, parent_id in pages:
+            children.setdefault(parent_id, []).append(page_id)
+        page_ids = []
+        level = children.get(None, [])
+        while level:
+            page_ids += level
+            level = [child for page_id in level for child in children.get(page_id, [])]
+        urls += [f'/api/pages/{page_id}/' for page_id in page_ids]
+        content_ids = (Content.objects.filter(page_id__in=page_ids)
+                       .order_by('page_id', 'title').values_list('id', flat=True))
+        urls += [f'/api/contents/{content_id}/' for content_id in content_ids]
+        return urls
+
+    @staticmethod
+    def dedupe(urls):
+        return list(dict.fromkeys(urls))
+
+    def client_fetcher(self, host):
+        local = threading.local()
+
+        def fetch(url):
+            if not hasattr(local, 'client'):
+                # Client() would send "Host: testserver", rejected outside DEBUG;
+                # marked internal so the throttles don't turn the warm-up into 429s.
+                # A view that raises is reported as a 500 row, not a traceback.
+                local.client = Client(HTTP_HOST=host, raise_request_exception=False,
+                                      **{INTERNAL_REQUEST_KEY: True})
+            started = time.perf_counter()
+            response = local.client.get(url)
+            ms = (time.perf_counter() - started) * 1000
+            size = len(response.content) if not response.streaming else 0
+            return {'url': url, 'status': response.status_code, 'ms': ms, 'bytes': size}
+
+        return fetch
+
+    def http_fetcher(self, base_url):
+        base_url = base_url.rstrip('/')
+
+        def fetch(url):
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(base_url + url, timeout=60) as response:
+                    status, size = response.status, len(response.read())
+            except urllib.error.HTTPError as exc:
+                status, size = exc.code, 0
+            except urllib.error.URLError:
+                status, size = 599, 0
+            ms = (time.perf_counter() - started) * 1000
+            return {'url': url, 'status': status, 'ms': ms, 'bytes': size}
+
+        return fetch
+
+
+def default_host():
+    for host in settings.ALLOWED_HOSTS:
+        host = host.lstrip('.')
+        if host and host != '*':
+            return host
+    return 'localhost'
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, round(pct / 100 * (len(sorted_values) - 1)))
+    return sorted_values[index]
@@ -0,0 +1,287 @@
+# rest/metrics.py
+import atexit
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# name -> (help text, buckets)
+HISTOGRAMS = {
+    'http_request_duration_seconds': ('Total request latency', DURATION_BUCKETS),
+    'http_request_sql_queries': ('SQL queries executed per request', QUERY_BUCKETS),
+    'http_request_sql_duration_seconds': ('Time spent in SQL per request', DURATION_BUCKETS),
+    'http_request_serialize_duration_seconds': ('Time spent in serializers per request', DURATION_BUCKETS),
+    'http_request_render_duration_seconds': ('Time spent rendering the response', DURATION_BUCKETS),
+    'http_response_size_bytes': ('Response body size', SIZE_BUCKETS),
+}
+
+
+class RequestTimings:
+    """Per-request counters filled in by the SQL wrapper and ``phase()``."""
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.phases = {}
+        self.depth = 0
+        # set to a list to record every statement (used by ProfilingMiddleware)
+        self.queries = None
+
+
+_current = ContextVar('request_timings', default=None)
+
+
+def start_request():
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def current_timings():
+    return _current.get()
+
+
+def sql_wrapper(execute, sql, params, many, context):
+    """``connection.execute_wrapper`` hook counting queries and SQL time."""
+    timings = _current.get()
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if timings is not None:
+            elapsed = time.perf_counter() - start
+            timings.sql_count += 1
+            timings.sql_time += elapsed
+            if timings.queries is not None:
+                timings.queries.append({'sql': sql, 'ms': round(elapsed * 1000, 3)})
+
+
+@contextmanager
+def phase(name):
+    """Time a block under ``name``; nested blocks only count the outermost one."""
+    timings = _current.get()
+    if timings is None or timings.depth:
+        if timings is not None:
+            timings.depth += 1
+        try:
+            yield
+        finally:
+            if timings is not None:
+                timings.depth -= 1
+        return
+    timings.depth = 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.depth = 0
+        timings.phases[name] = timings.phases.get(name, 0.0) + time.perf_counter() - start
+
+
+class Collector:
+    """
+    Process-local histograms, periodically flushed to
+    ``<METRICS_DIR>/<pid>-<random>.json``. The random part keeps a later process
+    that reuses the pid from overwriting (and lowering) the earlier counts.
+
+    Every worker writes its own file; ``collect()`` merges all of them so the
+    ``/metrics`` endpoint reports the same totals whichever worker serves it.
+    Files left behind by exited workers are folded into ``aggregate.json`` so
+    neither the directory nor the scrape grows with every restart. The pid
+    check means METRICS_DIR must not be shared between hosts or containers.
+    """
+
+    AGGREGATE = 'aggregate.json'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+        self._last_flush = 0.0
+        self._start()
+
+    def _start(self):
+        self._pid = os.getpid()
+        self._filename = f'{self._pid}-{uuid.uuid4().hex}.json'
+
+    @property
+    def directory(self):
+        return str(settings.METRICS_DIR)
+
+    def _observe(self, name, labels, value):
+        buckets = HISTOGRAMS[name][1]
+        series = self._series.setdefault(name, {})
+        key = '\t'.join(labels)
+        row = series.get(key)
+        if row is None:
+            # one slot per bucket, then +Inf, sum
+            row = series[key] = [0] * (len(buckets) + 1) + [0.0]
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                row[i] += 1
+                break
+        else:
+            row[len(buckets)] += 1
+        row[-1] += value
+
+    def observe_request(self, route, method, duration, timings, size):
+        labels = (route, method)
+        with self._lock:
+            self._check_fork()
+            self._observe('http_request_duration_seconds', labels, duration)
+            self._observe('http_request_sql_queries', labels, timings.sql_count)
+            self._observe('http_request_sql_duration_seconds', labels, timings.sql_time)
+            self._observe('http_request_serialize_duration_seconds', labels,
+                          timings.phases.get('serialize', 0.0))
+            self._observe('http_request_render_duration_seconds', labels,
+                          timings.phases.get('render', 0.0))
+            if size is not None:
+                self._observe('http_response_size_bytes', labels, size)
+        if time.monotonic() - self._last_flush >= settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def _check_fork(self):
+        if os.getpid() != self._pid:
+            # forked after import: don't inherit the parent's series or file
+            self._series = {}
+            self._start()
+
+    def flush(self):
+        with self._lock:
+            self._check_fork()
+            if not self._series:
+                return
+            payload = json.dumps(self._series)
+            filename = self._filename
+            self._last_flush = time.monotonic()
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, filename)
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as fh:
+            fh.write(payload)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _merge(merged, data):
+        for name, series in data.items():
+            if name not in HISTOGRAMS:
+                continue
+            target = merged.setdefault(name, {})
+            for key, row in series.items():
+                if key in target:
+                    target[key] = [a + b for a, b in zip(target[key], row)]
+                else:
+                    target[key] = list(row)
+
+    def _read(self, filename):
+        try:
+            with open(os.path.join(self.directory, filename)) as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return {}
+
+    def _listdir(self):
+        try:
+            return [name for name in os.listdir(self.directory) if name.endswith('.json')]
+        except FileNotFoundError:
+            return []
+
+    @contextmanager
+    def _locked(self, operation):
+        # readers share the lock so they never see a dead worker's file both
+        # on its own and already folded into the aggregate
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, '.lock'), 'a') as lock:
+            fcntl.flock(lock, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _is_dead(filename):
+        try:
+            pid = int(filename.split('-', 1)[0].split('.', 1)[0])
+        except ValueError:
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass
+        return False
+
+    def compact(self):
+        """Fold the files of exited workers into ``AGGREGATE`` and remove them."""
+        if not any(self._is_dead(name) for name in self._listdir() if name != self.AGGREGATE):
+            return
+        with self._locked(fcntl.LOCK_EX):
+            dead = [name for name in self._listdir()
+                    if name != self.AGGREGATE and self._is_dead(name)]
+            if not dead:
+                return
+            total = self._read(self.AGGREGATE)
+            for filename in dead:
+                self._merge(total, self._read(filename))
+            path = os.path.join(self.directory, self.AGGREGATE)
+            with open(f'{path}.tmp', 'w') as fh:
+                fh.write(json.dumps(total))
+            os.replace(f'{path}.tmp', path)
+            for filename in dead:
+                os.remove(os.path.join(self.directory, filename))
+
+    def collect(self):
+        self.flush()
+        self.compact()
+        merged = {}
+        with self._locked(fcntl.LOCK_SH):
+            for filename in self._listdir():
+                self._merge(merged, self._read(filename))
+        return merged
+
+    def render(self):
+        merged = self.collect()
+        lines = []
+        for name, (help_text, buckets) in HISTOGRAMS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for key, row in sorted(merged.get(name, {}).items()):
+                route, method = key.split('\t')
+                labels = f'route="{_escape(route)}",method="{method}"'
+                cumulative = 0
+                for bound, count in zip(buckets, row):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                cumulative += row[len(buckets)]
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}')
+                lines.append(f'{name}_sum{{{labels}}} {row[-1]}')
+                lines.append(f'{name}_count{{{labels}}} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+collector = Collector()
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        collector.flush()
+    except Exception:
+        pass
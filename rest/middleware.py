@@ -0,0 +1,202 @@
+# rest/middleware.py
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import JsonResponse
+from django.utils import timezone
+
+from . import db_router, metrics, profiling, throttling
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route or 'unnamed'
+
+
+class ConcurrencyLimitMiddleware:
+    """
+    Sheds requests under CONCURRENCY_LIMIT_PATHS with 503 + ``Retry-After``
+    while the requests in flight on this host are at the adaptive limit kept
+    by ``throttling.limiter``. Comes first so a shed request costs nothing.
+    Internal requests (``throttling.INTERNAL_REQUEST_KEY``) are never shed.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.paths = tuple(settings.CONCURRENCY_LIMIT_PATHS)
+
+    def __call__(self, request):
+        if not self.paths or not request.path.startswith(self.paths) \
+                or throttling.is_internal(request):
+            return self.get_response(request)
+        slot = throttling.limiter.acquire()
+        if slot is None:
+            response = JsonResponse(
+                {'detail': 'Server is busy, please retry later.'}, status=503)
+            response['Retry-After'] = str(throttling.limiter.retry_after())
+            return response
+        start = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            throttling.limiter.release(slot, time.perf_counter() - start)
+
+
+class ServerTimingMiddleware:
+    """
+    Records SQL, serializer and render time per route.
+
+    Staff users get the breakdown back as a ``Server-Timing`` header; everyone's
+    requests feed the histograms served at ``/metrics``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings, token = metrics.start_request()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(metrics.sql_wrapper))
+                response = self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        duration = time.perf_counter() - start
+
+        if response.streaming:
+            size = response.get('Content-Length')
+            size = int(size) if size else None
+        else:
+            size = len(response.content)
+        metrics.collector.observe_request(
+            route_name(request), request.method, duration, timings, size)
+
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            response['Server-Timing'] = self.server_timing(timings, duration)
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns; time that step
+        timings = metrics.current_timings()
+        if timings is not None:
+            render_start = time.perf_counter()
+
+            def finished(rendered):
+                timings.phases['render'] = time.perf_counter() - render_start
+
+            response.add_post_render_callback(finished)
+        return response
+
+    @staticmethod
+    def server_timing(timings, duration):
+        entries = [
+            f'sql;dur={timings.sql_time * 1000:.1f};desc="{timings.sql_count} queries"',
+        ]
+        for name in ('serialize', 'render'):
+            if name in timings.phases:
+                entries.append(f'{name};dur={timings.phases[name] * 1000:.1f}')
+        entries.append(f'total;dur={duration * 1000:.1f}')
+        return ', '.join(entries)
+
+
+class ProfilingMiddleware:
+    """
+    Profiles a sample of requests to the routes selected by enabled
+    ProfilingRule rows and keeps the ones slower than the rule's threshold.
+
+    Must come after ServerTimingMiddleware, which records the SQL list.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        request._profiling = None
+        response = self.get_response(request)
+        if request._profiling is None:
+            return response
+
+        rule, label, session, timings = request._profiling
+        session.stop()
+        duration_ms = (time.perf_counter() - start) * 1000
+        if duration_ms >= rule.threshold_ms:
+            profiling.captures.save({
+                'route': label,
+                'method': request.method,
+                'path': request.get_full_path(),
+                'status': response.status_code,
+                'mode': rule.mode,
+                'duration_ms': round(duration_ms, 1),
+                'sql_count': timings.sql_count,
+                'sql_ms': round(timings.sql_time * 1000, 1),
+                'queries': timings.queries,
+                'created_at': timezone.now().isoformat(),
+            }, session)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = metrics.current_timings()
+        if timings is None:
+            return None
+        label = profiling.view_label(view_func, request.method)
+        # record from here on: a rule reload is counted in sql_count, so a
+        # capture must list it too
+        timings.queries = []
+        rule = profiling.rule_for(label)
+        if rule is not None and random.random() * 100 < rule.sample_rate:
+            session = profiling.ProfileSession(rule.mode)
+            if session.start():
+                request._profiling = (rule, label, session, timings)
+                return None
+        timings.queries = None
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Lets ReplicaRouter serve safe-method requests to the ``rest.views`` API
+    from a replica. A request that writes pins the client to the primary for
+    REPLICA_STICKY_SECONDS through a cookie, so it reads its own writes.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            pinned = float(request.COOKIES.get(settings.REPLICA_PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            pinned = False
+        state, token = db_router.begin(
+            eligible=request.method in SAFE_METHODS and not pinned)
+        try:
+            response = self.get_response(request)
+        finally:
+            db_router.end(token)
+
+        if state.wrote or (request.method not in SAFE_METHODS and response.status_code < 400):
+            window = settings.REPLICA_STICKY_SECONDS
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE, str(time.time() + window),
+                max_age=int(window) + 1, httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = db_router.current()
+        cls = getattr(view_func, 'cls', None)
+        if state is not None and state.eligible and cls is not None \
+                and cls.__module__ == 'rest.views':
+            state.use_replica = True
+        return None
@@ -1,5 +1,8 @@
 import uuid
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models import Value
+from django.db.models.functions import Concat, Substr
 from django.utils.text import slugify
 from django_ckeditor_5.fields import CKEditor5Field
 
@@ -59,11 +62,30 @@ class Page(models.Model):
         verbose_name='Эцэг хуудас',
         help_text='Хэрэв энэ нь дэд хуудас бол эцэг хуудсыг сонгоно уу'
     )
+    # /<root id>/.../<own id>/, for subtree lookups by prefix (rest.tree).
+    # 33 characters a level: text, so any depth fits
+    path = models.TextField(
+        blank=True,
+        db_index=True,
+        editable=False,
+        verbose_name='Замын мөр'
+    )
 
     def save(self, *args, **kwargs):
+        from .tree import page_path
+
         if not self.slug:
             self.slug = slugify(self.title)
+        old_path = '' if self._state.adding else (
+            Page.objects.filter(pk=self.pk).values_list('path', flat=True).first() or '')
+        self.path = page_path(self)
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'path'}
         super().save(*args, **kwargs)
+        if old_path and old_path != self.path:
+            # moved: re-root every descendant's path
+            Page.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                path=Concat(Value(self.path), Substr('path', len(old_path) + 1)))
 
     def __str__(self):
         return self.title
@@ -178,6 +200,37 @@ class ContentImage(models.Model):
         help_text="Дараалал",
         verbose_name='Жагсаалтын дараалал'
     )
+    # Filled in by rest.tasks.process_content_image after upload
+    width = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Өргөн'
+    )
+    height = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Өндөр'
+    )
+    byte_size = models.PositiveBigIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Хэмжээ (байт)'
+    )
+    placeholder = models.CharField(
+        max_length=100,
+        blank=True,
+        editable=False,
+        verbose_name='Бүдэг дүрс (BlurHash)'
+    )
+    dominant_color = models.CharField(
+        max_length=7,
+        blank=True,
+        editable=False,
+        verbose_name='Давамгай өнгө'
+    )
 
     class Meta:
         ordering = ['order']
@@ -246,3 +299,230 @@ class VideoUrl(models.Model):
     class Meta:
         verbose_name = 'Видео'
         verbose_name_plural = 'Видеонууд'
+
+
+class ProfilingRule(models.Model):
+    MODE_CHOICES = [
+        ('sampling', 'Түүвэрлэлт (sampling)'),
+        ('deterministic', 'Бүрэн (cProfile)'),
+    ]
+
+    route = models.CharField(
+        max_length=200,
+        verbose_name='Маршрут',
+        help_text='Жишээ нь: PageViewSet.retrieve, PageViewSet эсвэл *'
+    )
+    mode = models.CharField(
+        max_length=20,
+        choices=MODE_CHOICES,
+        default='sampling',
+        verbose_name='Горим'
+    )
+    sample_rate = models.PositiveSmallIntegerField(
+        default=10,
+        validators=[MinValueValidator(1), MaxValueValidator(100)],
+        verbose_name='Хувь (%)',
+        help_text='Профайл хийх хүсэлтийн хувь'
+    )
+    threshold_ms = models.PositiveIntegerField(
+        default=500,
+        verbose_name='Босго (ms)',
+        help_text='Үүнээс удаан хүсэлтийн профайлыг хадгална'
+    )
+    is_enabled = models.BooleanField(
+        default=False,
+        verbose_name='Идэвхтэй эсэх'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Үүсгэсэн огноо'
+    )
+
+    def matches(self, label):
+        return self.route in ('*', label) or label.split('.')[0] == self.route
+
+    def __str__(self):
+        return f"{self.route} ({self.get_mode_display()}, {self.sample_rate}%)"
+
+    class Meta:
+        verbose_name = 'Профайлын дүрэм'
+        verbose_name_plural = 'Профайлын дүрмүүд'
+
+
+class Job(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'Дараалалд'),
+        ('running', 'Ажиллаж байна'),
+        ('done', 'Дууссан'),
+        ('failed', 'Амжилтгүй'),
+    ]
+
+    name = models.CharField(
+        max_length=200,
+        verbose_name='Даалгавар'
+    )
+    args = models.JSONField(
+        default=list,
+        blank=True,
+        verbose_name='Аргументууд'
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='queued',
+        verbose_name='Төлөв'
+    )
+    priority = models.IntegerField(
+        default=0,
+        verbose_name='Ач холбогдол',
+        help_text='Их утгатай нь түрүүлж ажиллана'
+    )
+    dedupe_key = models.CharField(
+        max_length=200,
+        blank=True,
+        null=True,
+        db_index=True,
+        verbose_name='Давхардлын түлхүүр',
+        help_text='Ижил түлхүүртэй хүлээгдэж буй ажил байвал шинээр нэмэхгүй'
+    )
+    attempts = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Оролдлого'
+    )
+    max_attempts = models.PositiveIntegerField(
+        default=3,
+        verbose_name='Дээд оролдлого'
+    )
+    run_at = models.DateTimeField(
+        verbose_name='Ажиллах хугацаа'
+    )
+    locked_until = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Түгжээ дуусах'
+    )
+    locked_by = models.CharField(
+        max_length=100,
+        blank=True,
+        verbose_name='Ажиллуулагч'
+    )
+    last_error = models.TextField(
+        blank=True,
+        verbose_name='Сүүлийн алдаа'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Үүсгэсэн огноо'
+    )
+    finished_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Дууссан огноо'
+    )
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.get_status_display()})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', '-priority', 'run_at'],
+                         name='rest_job_claim_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['dedupe_key'], condition=models.Q(status='queued'),
+                                    name='rest_job_queued_dedupe_uniq'),
+        ]
+        verbose_name = 'Арын ажил'
+        verbose_name_plural = 'Арын ажлууд'
+
+
+class MediaBlob(models.Model):
+    """One stored file of rest.storage.ContentAddressedStorage."""
+    sha256 = models.CharField(
+        max_length=64,
+        unique=True,
+        verbose_name='SHA-256'
+    )
+    name = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name='Файлын нэр'
+    )
+    size = models.PositiveBigIntegerField(
+        verbose_name='Хэмжээ (байт)'
+    )
+    refcount = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Ашиглагдсан тоо'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Үүсгэсэн огноо'
+    )
+    referenced_at = models.DateTimeField(
+        verbose_name='Сүүлд ашигласан',
+        help_text='manage.py sweep_media энэ хугацаанаас хойш хүлээх хугацааг тоолно'
+    )
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = 'Медиа файл'
+        verbose_name_plural = 'Медиа файлууд'
+
+
+class RelatedContent(models.Model):
+    """Precomputed "related articles" of a Content, best first (rest.related)."""
+    content = models.ForeignKey(
+        Content,
+        on_delete=models.CASCADE,
+        related_name='related_entries',
+        verbose_name='Контент'
+    )
+    related = models.ForeignKey(
+        Content,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Холбоотой контент'
+    )
+    score = models.FloatField(
+        verbose_name='Оноо'
+    )
+    rank = models.PositiveSmallIntegerField(
+        verbose_name='Эрэмбэ'
+    )
+
+    def __str__(self):
+        return f"{self.content_id} -> {self.related_id} #{self.rank}"
+
+    class Meta:
+        ordering = ['content', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['content', 'rank'], name='rest_related_content_rank_uniq'),
+        ]
+        verbose_name = 'Холбоотой контент'
+        verbose_name_plural = 'Холбоотой контентууд'
+
+
+class IndexGeneration(models.Model):
+    """
+    Change counter of an in-process index (rest.tag_index). Kept in the
+    database so every worker, on every host, sees the same value.
+    """
+    name = models.CharField(
+        max_length=100,
+        unique=True,
+        verbose_name='Нэр'
+    )
+    value = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name='Үе'
+    )
+
+    def __str__(self):
+        return f"{self.name} #{self.value}"
+
+    class Meta:
+        verbose_name = 'Индексийн үе'
+        verbose_name_plural = 'Индексийн үеүүд'
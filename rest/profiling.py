@@ -0,0 +1,169 @@
+# rest/profiling.py
+import cProfile
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+
+CAPTURE_ID_RE = re.compile(r'^[0-9]+-[0-9a-f]{8}$')
+ARTIFACTS = {'pstats': '.pstats', 'folded': '.folded'}
+
+# Only one cProfile profiler may be active per interpreter
+_cprofile_lock = threading.Lock()
+
+_rules = {'loaded_at': 0.0, 'rules': []}
+
+
+def view_label(view_func, method):
+    """``PageViewSet.retrieve``-style label for a resolved view."""
+    cls = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    if cls is None:
+        return view_func.__name__
+    actions = getattr(view_func, 'actions', None) or {}
+    return f"{cls.__name__}.{actions.get(method.lower(), method.lower())}"
+
+
+def rule_for(label):
+    """Enabled ProfilingRule matching ``label``, re-read every PROFILE_RULE_TTL seconds."""
+    from .models import ProfilingRule
+
+    now = time.monotonic()
+    if now - _rules['loaded_at'] >= settings.PROFILE_RULE_TTL:
+        _rules['rules'] = list(ProfilingRule.objects.filter(is_enabled=True))
+        _rules['loaded_at'] = now
+    for rule in _rules['rules']:
+        if rule.matches(label):
+            return rule
+    return None
+
+
+class Sampler:
+    """Collects folded stacks of one thread by polling ``sys._current_frames()``."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def folded(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class ProfileSession:
+    def __init__(self, mode):
+        self.mode = mode
+        self._profiler = None
+        self._sampler = None
+
+    def start(self):
+        if self.mode == 'deterministic':
+            if not _cprofile_lock.acquire(blocking=False):
+                return False
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            self._sampler = Sampler(settings.PROFILE_SAMPLE_INTERVAL)
+            self._sampler.start()
+        return True
+
+    def stop(self):
+        if self._profiler is not None:
+            self._profiler.disable()
+            _cprofile_lock.release()
+        if self._sampler is not None:
+            self._sampler.stop()
+
+    def dump(self, base_path):
+        """Write the profile next to ``base_path`` and return the artifact kinds written."""
+        if self._profiler is not None:
+            self._profiler.dump_stats(base_path + ARTIFACTS['pstats'])
+            return ['pstats']
+        with open(base_path + ARTIFACTS['folded'], 'w') as fh:
+            fh.write(self._sampler.folded())
+        return ['folded']
+
+
+class CaptureStore:
+    """
+    Ring buffer of slow-request captures on disk.
+
+    Each capture is ``<id>.json`` (request info and SQL list) plus its profile
+    artifact; once PROFILE_CAPTURE_LIMIT is exceeded the oldest are removed.
+    """
+
+    @property
+    def directory(self):
+        return str(settings.PROFILE_CAPTURE_DIR)
+
+    def save(self, meta, session):
+        os.makedirs(self.directory, exist_ok=True)
+        capture_id = f"{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}"
+        base_path = os.path.join(self.directory, capture_id)
+        meta = dict(meta, id=capture_id, artifacts=session.dump(base_path))
+        with open(base_path + '.json.tmp', 'w') as fh:
+            json.dump(meta, fh)
+        os.replace(base_path + '.json.tmp', base_path + '.json')
+        self.prune()
+        return capture_id
+
+    def ids(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted((name[:-5] for name in names if name.endswith('.json')), reverse=True)
+
+    def prune(self):
+        for capture_id in self.ids()[settings.PROFILE_CAPTURE_LIMIT:]:
+            for suffix in ('.json', *ARTIFACTS.values()):
+                try:
+                    os.remove(os.path.join(self.directory, capture_id + suffix))
+                except FileNotFoundError:
+                    pass
+
+    def get(self, capture_id):
+        if not CAPTURE_ID_RE.match(capture_id):
+            return None
+        try:
+            with open(os.path.join(self.directory, capture_id + '.json')) as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def all(self):
+        return [meta for meta in map(self.get, self.ids()) if meta is not None]
+
+    def artifact_path(self, capture_id, kind):
+        if not CAPTURE_ID_RE.match(capture_id) or kind not in ARTIFACTS:
+            return None
+        path = os.path.join(self.directory, capture_id + ARTIFACTS[kind])
+        return path if os.path.exists(path) else None
+
+
+captures = CaptureStore()
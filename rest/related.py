@@ -0,0 +1,184 @@
+# rest/related.py
+"""
+Related contents, precomputed: for every Content, the RELATED_CONTENT_TOP_K
+contents sharing the most tags with it, favouring recent ones. They are
+stored in ``RelatedContent``, so serving them is one indexed read.
+
+    similarity(a, b) = |tags(a) & tags(b)| / sqrt(|tags(a)| * |tags(b)|)
+    score(a, b)      = log2(similarity(a, b)) + (b.created_at - EPOCH) / half-life
+
+Recency is measured from a fixed epoch, not from now, so scores written at
+different times stay comparable and a tag change only rewrites the lists it
+affects. Scores are kept in log space: the linear weight
+``2 ** (t / half-life)`` overflows a float within a few years of the epoch
+when the half-life is short. Contents without ``created_at`` count as
+created at the epoch. ``display_score()`` turns a stored score back into
+``similarity * 0.5 ** (age / half-life)``.
+
+The content x tag matrix is held as sparse dicts (rows and per-tag posting
+lists); one row of A.A^T is a Counter over the posting lists of its tags.
+A rebuild loads all of it; incremental updates load only the posting lists
+around the changed contents (``TagMatrix.around()``).
+"""
+import heapq
+import math
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+EPOCH = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def recency(created_at):
+    """log2 of the recency weight: half-lives from EPOCH to ``created_at`` (0 if unknown)."""
+    if created_at is None:
+        return 0.0
+    half_life = settings.RELATED_CONTENT_HALF_LIFE_DAYS * 86400
+    return (created_at - EPOCH).total_seconds() / half_life
+
+
+def score_offset():
+    """Recency of now; ``display_score()`` subtracts it from stored scores."""
+    return recency(timezone.now())
+
+
+def display_score(score, offset):
+    """similarity x 0.5 ** (age / half-life). Capped at 1 for contents dated in the future."""
+    return 2.0 ** min(score - offset, 0.0)
+
+
+class TagMatrix:
+    """Binary content x tag matrix: ``rows[content] = {tags}``, ``columns[tag] = {contents}``."""
+
+    def __init__(self, pairs, created):
+        self.rows = {}
+        self.columns = {}
+        for content_id, tag_id in pairs:
+            self.rows.setdefault(content_id, set()).add(tag_id)
+            self.columns.setdefault(tag_id, set()).add(content_id)
+        self.recency = {content_id: recency(created_at)
+                        for content_id, created_at in created}
+
+    @classmethod
+    def load(cls):
+        from .models import Content
+
+        return cls(Content.tags.through.objects.values_list('content_id', 'tag_id'),
+                   Content.objects.values_list('id', 'created_at'))
+
+    @classmethod
+    def around(cls, content_ids):
+        """
+        The part of the matrix ``similarities()`` needs for ``content_ids``:
+        the full posting lists of their tags and the full rows of every
+        content on them. Other rows and columns are missing or partial.
+        """
+        from .models import Content
+
+        through = Content.tags.through.objects
+        neighbours = through.filter(
+            tag_id__in=through.filter(content_id__in=content_ids).values('tag_id')).values('content_id')
+        return cls(through.filter(content_id__in=neighbours).values_list('content_id', 'tag_id'),
+                   Content.objects.filter(id__in=neighbours).values_list('id', 'created_at'))
+
+    def similarities(self, content_id):
+        """{other: similarity} for every content sharing a tag with ``content_id``."""
+        tags = self.rows.get(content_id)
+        if not tags:
+            return {}
+        overlap = Counter()
+        for tag_id in tags:
+            overlap.update(self.columns[tag_id])
+        del overlap[content_id]
+        size = len(tags)
+        return {other: shared / math.sqrt(size * len(self.rows[other]))
+                for other, shared in overlap.items()}
+
+    def top(self, content_id, k):
+        """[(other, score)] best first; ties go to the lower id."""
+        scores = ((other, math.log2(similarity) + self.recency[other])
+                  for other, similarity in self.similarities(content_id).items())
+        return heapq.nlargest(k, scores, key=lambda item: (item[1], -item[0]))
+
+
+def write_lists(content_ids, matrix, k):
+    """Replace the stored lists of ``content_ids`` with fresh top-k lists."""
+    from .models import RelatedContent
+
+    rows = [RelatedContent(content_id=content_id, related_id=other, score=score, rank=rank)
+            for content_id in content_ids if content_id in matrix.recency
+            for rank, (other, score) in enumerate(matrix.top(content_id, k))]
+    with transaction.atomic():
+        RelatedContent.objects.filter(content_id__in=content_ids).delete()
+        RelatedContent.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def rebuild(k=None):
+    """Recompute every list. Returns (contents, rows written)."""
+    from .models import RelatedContent
+
+    k = k or settings.RELATED_CONTENT_TOP_K
+    matrix = TagMatrix.load()
+    content_ids = list(matrix.recency)
+    with transaction.atomic():
+        RelatedContent.objects.all().delete()
+        written = write_lists(content_ids, matrix, k)
+    return len(content_ids), written
+
+
+def affected_by(content_id, matrix, k):
+    """
+    Contents whose list may change after ``content_id``'s tags changed: itself,
+    the lists it is already in, and the lists its new score would enter.
+    """
+    from .models import RelatedContent
+
+    affected = {content_id}
+    affected.update(RelatedContent.objects.filter(related_id=content_id)
+                    .values_list('content_id', flat=True))
+    own_recency = matrix.recency.get(content_id)
+    if own_recency is None:
+        return affected
+    # similarity is symmetric; only the recency term is content_id's own
+    candidates = {other: math.log2(similarity) + own_recency
+                  for other, similarity in matrix.similarities(content_id).items()
+                  if other not in affected}
+    # each candidate's list length and its last entry, compared with the
+    # (score, -id) key top() ranks by, so ties are decided the same way
+    counts, lowest = Counter(), {}
+    for other, rank, score, related_id in (
+            RelatedContent.objects.filter(content_id__in=list(candidates))
+            .values_list('content_id', 'rank', 'score', 'related_id')):
+        counts[other] += 1
+        if other not in lowest or rank > lowest[other][0]:
+            lowest[other] = (rank, score, related_id)
+    for other, score in candidates.items():
+        if counts[other] < k:
+            affected.add(other)
+            continue
+        _, stored_score, stored_id = lowest[other]
+        if (score, -content_id) > (stored_score, -stored_id):
+            affected.add(other)
+    return affected
+
+
+def update(content_ids, k=None):
+    """Bring the table up to date after the tags of ``content_ids`` changed."""
+    k = k or settings.RELATED_CONTENT_TOP_K
+    matrix = TagMatrix.around(content_ids)
+    affected = set()
+    for content_id in content_ids:
+        affected |= affected_by(content_id, matrix, k)
+    refresh(affected, k)
+    return affected
+
+
+def refresh(content_ids, k=None):
+    """Recompute the lists of ``content_ids`` only, e.g. after one of their entries was deleted."""
+    k = k or settings.RELATED_CONTENT_TOP_K
+    content_ids = set(content_ids)
+    return write_lists(content_ids, TagMatrix.around(list(content_ids)), k)
@@ -0,0 +1,175 @@
+# rest/schema.py
+"""
+OpenAPI document served from a file generated at build time
+(``manage.py generate_openapi``). drf-yasg is only imported to generate that
+file, or for every request when ``OPENAPI_DYNAMIC`` is on.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.shortcuts import render
+from django.urls import reverse
+from django.views.decorators.http import condition, require_safe
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_INFO = {
+    'title': "College Website API",
+    'default_version': 'v1',
+    'description': "API for college news management",
+    'terms_of_service': "https://www.example.com/terms/",
+    'contact': {'email': "contact@college.example"},
+    'license': {'name': "MIT License"},
+}
+
+_lock = threading.Lock()
+_loaded = {}
+
+
+def schema_path():
+    return os.path.join(str(settings.OPENAPI_SCHEMA_DIR),
+                        f"openapi-{SCHEMA_INFO['default_version']}.json")
+
+
+def schema_info():
+    from drf_yasg import openapi
+
+    info = dict(SCHEMA_INFO)
+    info['contact'] = openapi.Contact(**info['contact'])
+    info['license'] = openapi.License(**info['license'])
+    return openapi.Info(**info)
+
+
+def get_schema_view():
+    """drf-yasg's schema view, imported and built on first use."""
+    if 'view' not in _loaded:
+        from drf_yasg.views import get_schema_view as yasg_schema_view
+        from rest_framework import permissions
+
+        _loaded['view'] = yasg_schema_view(
+            schema_info(),
+            public=True,
+            permission_classes=(permissions.AllowAny,),
+        )
+    return _loaded['view']
+
+
+def generate_schema():
+    """Build the OpenAPI document and return it as canonical JSON bytes."""
+    from drf_yasg.codecs import OpenAPICodecJson
+    from drf_yasg.generators import OpenAPISchemaGenerator
+    from rest_framework.test import APIRequestFactory
+    from rest_framework.views import APIView
+
+    # viewsets read request.query_params in get_queryset(), so give them one
+    request = APIView().initialize_request(APIRequestFactory().get(reverse('schema-json')))
+    document = OpenAPISchemaGenerator(info=schema_info()).get_schema(request=request, public=True)
+    data = json.loads(OpenAPICodecJson(validators=[]).encode(document))
+    # leave host/scheme out so clients use whichever host served the file
+    data.pop('host', None)
+    data.pop('schemes', None)
+    return json.dumps(data, sort_keys=True, indent=2, ensure_ascii=False).encode()
+
+
+def write_schema(content):
+    path = schema_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'wb') as fh:
+        fh.write(content)
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def load_schema():
+    """(bytes, etag) of the generated file, re-read when its mtime changes."""
+    path = schema_path()
+    with _lock:
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            logger.warning("%s is missing; generating it now. Run manage.py "
+                           "generate_openapi at build time instead.", path)
+            write_schema(generate_schema())
+            mtime = os.stat(path).st_mtime
+        if _loaded.get('mtime') != mtime:
+            with open(path, 'rb') as fh:
+                content = fh.read()
+            _loaded.update(mtime=mtime, content=content,
+                           etag=hashlib.sha256(content).hexdigest()[:32])
+        return _loaded['content'], _loaded['etag']
+
+
+def schema_json(request):
+    if settings.OPENAPI_DYNAMIC:
+        return get_schema_view().without_ui(cache_timeout=0)(request)
+    return static_schema_json(request)
+
+
+@require_safe
+@condition(etag_func=lambda request: load_schema()[1])
+def static_schema_json(request):
+    content, _ = load_schema()
+    response = HttpResponse(content, content_type='application/json')
+    response['Cache-Control'] = 'public, max-age=0, must-revalidate'
+    return response
+
+
+def swagger_ui(request):
+    if settings.OPENAPI_DYNAMIC:
+        return get_schema_view().with_ui('swagger', cache_timeout=0)(request)
+    if request.GET.get('format') == 'openapi':
+        return schema_json(request)
+    swagger_settings = {
+        'url': reverse('schema-json'),
+        'docExpansion': 'list',
+        'deepLinking': False,
+        'showExtensions': True,
+        'defaultModelRendering': 'model',
+        'defaultModelExpandDepth': 3,
+        'defaultModelsExpandDepth': 3,
+        'showCommonExtensions': True,
+        'supportedSubmitMethods': ['get', 'put', 'post', 'delete', 'options', 'head', 'patch', 'trace'],
+        'displayOperationId': True,
+        'persistAuth': False,
+        'refetchWithAuth': False,
+        'refetchOnLogout': False,
+        'fetchSchemaWithQuery': True,
+        'csrfCookie': settings.CSRF_COOKIE_NAME,
+        'csrfHeader': 'X-CSRFToken',
+    }
+    return render(request, 'drf-yasg/swagger-ui.html', {
+        'title': SCHEMA_INFO['title'],
+        'version': SCHEMA_INFO['default_version'],
+        'swagger_settings': json.dumps(swagger_settings),
+        'oauth2_config': '{}',
+        'USE_SESSION_AUTH': True,
+        'LOGIN_URL': reverse('admin:login'),
+        'LOGOUT_URL': reverse('admin:logout'),
+    })
+
+
+def redoc_ui(request):
+    if settings.OPENAPI_DYNAMIC:
+        return get_schema_view().with_ui('redoc', cache_timeout=0)(request)
+    if request.GET.get('format') == 'openapi':
+        return schema_json(request)
+    redoc_settings = {
+        'url': reverse('schema-json'),
+        'lazyRendering': False,
+        'hideHostname': False,
+        'expandResponses': 'all',
+        'pathInMiddlePanel': False,
+        'nativeScrollbars': False,
+        'requiredPropsFirst': False,
+        'fetchSchemaWithQuery': True,
+    }
+    return render(request, 'drf-yasg/redoc.html', {
+        'title': SCHEMA_INFO['title'],
+        'version': SCHEMA_INFO['default_version'],
+        'redoc_settings': json.dumps(redoc_settings),
+    })
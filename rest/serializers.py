@@ -1,9 +1,18 @@
 # rest/serializers.py
 from rest_framework import serializers
-from .models import Page, Tag, Content, ContentImage, ContentText, VideoUrl
+from .models import Page, Tag, Content, ContentImage, ContentText, VideoUrl, RelatedContent
+from .metrics import phase
+from .related import display_score
 
 
-class PageNavigationSerializer(serializers.ModelSerializer):
+class InstrumentedModelSerializer(serializers.ModelSerializer):
+    # Reports serializer time to ServerTimingMiddleware (outermost call only)
+    def to_representation(self, instance):
+        with phase('serialize'):
+            return super().to_representation(instance)
+
+
+class PageNavigationSerializer(InstrumentedModelSerializer):
     children = serializers.SerializerMethodField()
 
     class Meta:
@@ -16,30 +25,31 @@ class PageNavigationSerializer(serializers.ModelSerializer):
         return PageNavigationSerializer(children, many=True, context=self.context).data
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(InstrumentedModelSerializer):
     class Meta:
         model = Tag
         fields = ['id', 'name', 'slug']
 
 
-class ContentImageSerializer(serializers.ModelSerializer):
+class ContentImageSerializer(InstrumentedModelSerializer):
     image_url = serializers.SerializerMethodField()
 
     class Meta:
         model = ContentImage
-        fields = ['id', 'image', 'image_url', 'text', 'order']
+        fields = ['id', 'image', 'image_url', 'text', 'order', 'width', 'height',
+                  'byte_size', 'placeholder', 'dominant_color']
 
     def get_image_url(self, obj):
         return obj.image.url if obj.image else None
 
 
-class ContentTextSerializer(serializers.ModelSerializer):
+class ContentTextSerializer(InstrumentedModelSerializer):
     class Meta:
         model = ContentText
         fields = ['id', 'text', 'order']
 
 
-class ContentListSerializer(serializers.ModelSerializer):
+class ContentListSerializer(InstrumentedModelSerializer):
     image = serializers.SerializerMethodField()
     tags = TagSerializer(many=True, read_only=True)
     created_at = serializers.DateTimeField(format='%Y-%m-%d')
@@ -49,13 +59,34 @@ class ContentListSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'image', 'description', 'created_at', 'tags']
 
     def get_image(self, obj):
-        first_image = obj.images.order_by('order').first()
+        if 'images' in getattr(obj, '_prefetched_objects_cache', {}):
+            # already ordered by ContentImage.Meta.ordering
+            first_image = next(iter(obj.images.all()), None)
+        else:
+            first_image = obj.images.order_by('order').first()
         if first_image:
             return ContentImageSerializer(first_image, context=self.context).data
         return None
 
 
-class ContentSerializer(serializers.ModelSerializer):
+class RelatedContentSerializer(InstrumentedModelSerializer):
+    id = serializers.IntegerField(source='related.id')
+    title = serializers.CharField(source='related.title')
+    slug = serializers.CharField(source='related.slug')
+    description = serializers.CharField(source='related.description')
+    created_at = serializers.DateTimeField(source='related.created_at', format='%Y-%m-%d')
+    score = serializers.SerializerMethodField()
+
+    class Meta:
+        model = RelatedContent
+        fields = ['id', 'title', 'slug', 'description', 'created_at', 'score']
+
+    def get_score(self, obj):
+        # tag similarity x recency decay as of today (see rest.related)
+        return round(display_score(obj.score, self.context['score_offset']), 6)
+
+
+class ContentSerializer(InstrumentedModelSerializer):
     tags = TagSerializer(many=True, read_only=True)
     images = ContentImageSerializer(many=True, read_only=True)
     texts = ContentTextSerializer(many=True, read_only=True)
@@ -67,7 +98,7 @@ class ContentSerializer(serializers.ModelSerializer):
                   'page', 'page_title', 'images', 'texts']
 
 
-class PageSerializer(serializers.ModelSerializer):
+class PageSerializer(InstrumentedModelSerializer):
     contents = ContentSerializer(many=True, read_only=True)
     template_display = serializers.CharField(
         source='get_template_display', read_only=True)
@@ -81,7 +112,7 @@ class PageSerializer(serializers.ModelSerializer):
         ]
 
 
-class VideoSerializer(serializers.ModelSerializer):
+class VideoSerializer(InstrumentedModelSerializer):
     video_source = serializers.ReadOnlyField()
 
     class Meta:
@@ -0,0 +1,120 @@
+# rest/signals.py
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import Content, ContentImage, RelatedContent, Tag, VideoUrl
+from .storage import ContentAddressedStorage
+from .tag_index import tag_index
+from .tasks import (
+    process_content_image, rebuild_related_content, refresh_related_content, update_related_content
+)
+
+
+@receiver(m2m_changed, sender=Content.tags.through)
+def update_tag_index(sender, instance, action, reverse, pk_set, **kwargs):
+    # reverse=False: instance is a Content and pk_set holds tag ids
+    if action in ('post_add', 'post_remove'):
+        if reverse:
+            tag_ids, content_ids = [instance.pk], list(pk_set)
+        else:
+            tag_ids, content_ids = list(pk_set), [instance.pk]
+        apply = tag_index.add if action == 'post_add' else tag_index.remove
+        transaction.on_commit(lambda: apply(tag_ids, content_ids))
+    elif action == 'post_clear':
+        if reverse:
+            transaction.on_commit(lambda: tag_index.clear_tag(instance.pk))
+        else:
+            transaction.on_commit(lambda: tag_index.remove_content([instance.pk]))
+
+
+@receiver(post_delete, sender=Content)
+def remove_content_from_tag_index(sender, instance, **kwargs):
+    # cascade deletes of the through rows don't send m2m_changed
+    content_id = instance.pk
+    transaction.on_commit(lambda: tag_index.remove_content([content_id]))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag_index(sender, **kwargs):
+    transaction.on_commit(tag_index.invalidate)
+
+
+@receiver(m2m_changed, sender=Content.tags.through)
+def queue_related_content_update(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse and action == 'post_clear':
+        # the cleared tag's contents are no longer known
+        rebuild_related_content.enqueue(dedupe_key='related-content:rebuild')
+        return
+    if not reverse:
+        update_related_content.enqueue([instance.pk], dedupe_key=f'related-content:{instance.pk}')
+    elif len(pk_set) > settings.RELATED_CONTENT_BULK_LIMIT:
+        # every update would load the same large posting list; redo it all once
+        rebuild_related_content.enqueue(dedupe_key='related-content:rebuild')
+    elif pk_set:
+        update_related_content.enqueue(sorted(pk_set))
+
+
+@receiver(pre_delete, sender=Content)
+def queue_related_content_refresh(sender, instance, **kwargs):
+    # the lists that show this content lose an entry when it is deleted
+    content_ids = list(RelatedContent.objects.filter(related_id=instance.pk)
+                       .exclude(content_id=instance.pk).values_list('content_id', flat=True))
+    if content_ids:
+        refresh_related_content.enqueue(content_ids)
+
+
+@receiver(post_delete, sender=Tag)
+def queue_related_content_rebuild(sender, **kwargs):
+    # cascade deletes of the through rows don't send m2m_changed
+    rebuild_related_content.enqueue(dedupe_key='related-content:rebuild')
+
+
+@receiver(pre_save, sender=ContentImage)
+def note_content_image_upload(sender, instance, **kwargs):
+    # a new upload is still uncommitted here; FileField.pre_save stores it later
+    instance._image_uploaded = bool(instance.image) and not instance.image._committed
+
+
+@receiver(post_save, sender=ContentImage)
+def queue_content_image_processing(sender, instance, created, **kwargs):
+    if not (created or instance._image_uploaded or not instance.placeholder):
+        return
+    process_content_image.enqueue(
+        instance.pk, dedupe_key=f'content-image:{instance.pk}')
+
+
+MEDIA_FIELDS = {ContentImage: 'image', VideoUrl: 'video_file'}
+
+
+def release_media(field, name):
+    if name and isinstance(field.storage, ContentAddressedStorage):
+        transaction.on_commit(lambda: field.storage.release(name))
+
+
+@receiver(pre_save, sender=ContentImage)
+@receiver(pre_save, sender=VideoUrl)
+def note_replaced_media(sender, instance, **kwargs):
+    field_name = MEDIA_FIELDS[sender]
+    instance._replaced_media = None
+    if not instance._state.adding:
+        old = sender.objects.filter(pk=instance.pk).values_list(field_name, flat=True).first()
+        if old and old != getattr(instance, field_name).name:
+            instance._replaced_media = old
+
+
+@receiver(post_save, sender=ContentImage)
+@receiver(post_save, sender=VideoUrl)
+def release_replaced_media(sender, instance, **kwargs):
+    release_media(sender._meta.get_field(MEDIA_FIELDS[sender]), instance._replaced_media)
+
+
+@receiver(post_delete, sender=ContentImage)
+@receiver(post_delete, sender=VideoUrl)
+def release_deleted_media(sender, instance, **kwargs):
+    field_name = MEDIA_FIELDS[sender]
+    release_media(sender._meta.get_field(field_name), getattr(instance, field_name).name)
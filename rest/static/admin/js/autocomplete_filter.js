@@ -0,0 +1,20 @@
+(function ($) {
+  $(document).ready(function () {
+    // Reload the changelist when a value is picked in an autocomplete filter
+    $(".autocomplete-filter select").on("change", function () {
+      var base = $(this).closest(".autocomplete-filter").data("query-string");
+      var value = $(this).val();
+      if (!value) {
+        window.location.search = base;
+        return;
+      }
+      var separator = base.length > 1 ? "&" : "";
+      window.location.search =
+        base +
+        separator +
+        encodeURIComponent(this.name) +
+        "=" +
+        encodeURIComponent(value);
+    });
+  });
+})(django.jQuery);
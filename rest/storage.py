@@ -0,0 +1,96 @@
+# rest/storage.py
+"""
+Content-addressed media storage. Every file is stored once, under the SHA-256
+of its bytes, so its URL never changes meaning and can be cached forever.
+``MediaBlob`` counts how many references each file has; rows at zero are
+removed by ``manage.py sweep_media``.
+"""
+import hashlib
+import os
+import posixpath
+import re
+import uuid
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+# <upload dir>/<2 hex>/<64 hex>[.ext]
+HASHED_NAME_RE = re.compile(r'(?:^|/)([0-9a-f]{2})/(\1[0-9a-f]{62})(\.[a-z0-9]{1,10})?$')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def file_digest(content):
+    sha = hashlib.sha256()
+    size = 0
+    for chunk in content.chunks():
+        sha.update(chunk)
+        size += len(chunk)
+    return sha.hexdigest(), size
+
+
+def is_hashed_name(name):
+    return HASHED_NAME_RE.search(name) is not None
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    ``FileSystemStorage`` that saves ``<dir>/photo.JPG`` as
+    ``<dir>/<sha[:2]>/<sha>.jpg``. Saving bytes that are already stored
+    returns the existing name and adds a reference instead of a second copy.
+    """
+    default_directory = ''
+
+    def hashed_name(self, name, digest):
+        directory = posixpath.dirname(name) or self.default_directory
+        ext = posixpath.splitext(name)[1].lower()
+        if not re.fullmatch(r'\.[a-z0-9]{1,10}', ext):
+            ext = ''
+        return posixpath.join(directory, digest[:2], digest + ext)
+
+    def _save(self, name, content):
+        from .models import MediaBlob
+
+        digest, size = file_digest(content)
+        now = timezone.now()
+        blobs = MediaBlob.objects.filter(sha256=digest)
+        # the UPDATE waits for a sweep that is deleting this blob, see sweep_media
+        if blobs.update(refcount=F('refcount') + 1, referenced_at=now):
+            stored = blobs.values_list('name', flat=True).get()
+            if not self.exists(stored):
+                self._write(stored, content)
+            return stored
+
+        stored = self.hashed_name(name, digest)
+        self._write(stored, content)
+        try:
+            with transaction.atomic():
+                MediaBlob.objects.create(sha256=digest, name=stored, size=size,
+                                         refcount=1, referenced_at=now)
+        except IntegrityError:
+            # a concurrent upload of the same bytes created the row first
+            blobs.update(refcount=F('refcount') + 1, referenced_at=now)
+            stored = blobs.values_list('name', flat=True).get()
+        return stored
+
+    def _write(self, name, content):
+        # write next to the target and rename, so a half-written file never
+        # appears under a hash name
+        temp_name = posixpath.join(posixpath.dirname(name), f'.{uuid.uuid4().hex}.tmp')
+        temp_name = super()._save(temp_name, content)
+        os.replace(self.path(temp_name), self.path(name))
+
+    def release(self, name):
+        """Drop one reference to ``name``; unknown (pre-hashing) names are ignored."""
+        from .models import MediaBlob
+
+        if name and is_hashed_name(name):
+            MediaBlob.objects.filter(name=name, refcount__gt=0).update(
+                refcount=F('refcount') - 1, referenced_at=timezone.now())
+
+
+class CKEditorUploadStorage(ContentAddressedStorage):
+    # django-ckeditor-5 saves uploads under their bare file name
+    default_directory = settings.CKEDITOR_5_UPLOAD_PATH.strip('/')
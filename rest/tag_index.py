@@ -0,0 +1,165 @@
+# rest/tag_index.py
+import threading
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+GENERATION_NAME = 'tag_index'
+
+
+def current_generation():
+    from .models import IndexGeneration
+
+    return (IndexGeneration.objects.filter(name=GENERATION_NAME)
+            .values_list('value', flat=True).first() or 0)
+
+
+def next_generation():
+    """Increment the shared generation and return the new value."""
+    from .models import IndexGeneration
+
+    counter = IndexGeneration.objects.filter(name=GENERATION_NAME)
+    if not counter.update(value=F('value') + 1):
+        try:
+            with transaction.atomic():
+                IndexGeneration.objects.create(name=GENERATION_NAME, value=1)
+        except IntegrityError:
+            counter.update(value=F('value') + 1)
+    return current_generation()
+
+
+def to_bitmap(ids):
+    """Pack integer ids into an int used as a bitset (bit ``id`` is set)."""
+    ids = list(ids)
+    if not ids:
+        return 0
+    bits = bytearray(max(ids) // 8 + 1)
+    for i in ids:
+        bits[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def from_bitmap(bitmap):
+    """Ids whose bit is set, ascending."""
+    ids = []
+    digits = bin(bitmap)[:1:-1]
+    i = digits.find('1')
+    while i != -1:
+        ids.append(i)
+        i = digits.find('1', i + 1)
+    return ids
+
+
+class TagIndex:
+    """
+    In-process tag -> content-id bitmap index.
+
+    Built with one query over the ``Content.tags`` through table and then kept
+    up to date from ``m2m_changed``/``post_delete`` (see ``rest.signals``).
+    A generation counter in the database (``IndexGeneration``) tells other
+    workers to rebuild after a change they did not see; checking it costs one
+    primary-key read per lookup.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._bitmaps = None
+        self._tags = {}
+        self._slugs = {}
+        self._generation = None
+
+    def _ensure(self):
+        generation = current_generation()
+        if self._bitmaps is None or generation != self._generation:
+            self.rebuild(generation)
+
+    def rebuild(self, generation=None):
+        from .models import Content, Tag
+
+        if generation is None:
+            generation = current_generation()
+        with self._lock:
+            members = {}
+            for tag_id, content_id in Content.tags.through.objects.values_list('tag_id', 'content_id'):
+                members.setdefault(tag_id, []).append(content_id)
+            self._tags = {tag['id']: tag for tag in Tag.objects.values('id', 'name', 'slug')}
+            self._slugs = {tag['slug']: tag_id for tag_id, tag in self._tags.items()}
+            self._bitmaps = {tag_id: to_bitmap(members.get(tag_id, ())) for tag_id in self._tags}
+            self._generation = generation
+
+    def _changed(self):
+        # Must be called with the lock held, after applying a local change
+        generation = next_generation()
+        if self._generation is not None and generation == self._generation + 1:
+            self._generation = generation
+        else:
+            # another worker changed the index in between; reload next time
+            self._bitmaps = None
+
+    def add(self, tag_ids, content_ids):
+        with self._lock:
+            if self._bitmaps is not None:
+                delta = to_bitmap(content_ids)
+                for tag_id in tag_ids:
+                    self._bitmaps[tag_id] = self._bitmaps.get(tag_id, 0) | delta
+            self._changed()
+
+    def remove(self, tag_ids, content_ids):
+        with self._lock:
+            if self._bitmaps is not None:
+                delta = to_bitmap(content_ids)
+                for tag_id in tag_ids:
+                    self._bitmaps[tag_id] = self._bitmaps.get(tag_id, 0) & ~delta
+            self._changed()
+
+    def remove_content(self, content_ids):
+        with self._lock:
+            if self._bitmaps is not None:
+                delta = to_bitmap(content_ids)
+                for tag_id, bitmap in self._bitmaps.items():
+                    self._bitmaps[tag_id] = bitmap & ~delta
+            self._changed()
+
+    def clear_tag(self, tag_id):
+        with self._lock:
+            if self._bitmaps is not None:
+                self._bitmaps[tag_id] = 0
+            self._changed()
+
+    def invalidate(self):
+        """Drop the index everywhere, e.g. after a Tag is renamed or deleted."""
+        with self._lock:
+            self._bitmaps = None
+            self._changed()
+
+    def match(self, slugs, operator='or'):
+        """Bitmap of contents tagged with all (``and``) or any (``or``) of ``slugs``."""
+        with self._lock:
+            self._ensure()
+            bitmaps = [self._bitmaps.get(self._slugs.get(slug), 0) for slug in slugs]
+        if not bitmaps:
+            return 0
+        result = bitmaps[0]
+        for bitmap in bitmaps[1:]:
+            result = result & bitmap if operator == 'and' else result | bitmap
+        return result
+
+    def facets(self, within=None):
+        """
+        Per-tag content counts, restricted to the ``within`` bitmap if given.
+        Tags with no matching content are left out.
+        """
+        with self._lock:
+            self._ensure()
+            items = [(self._tags[tag_id], bitmap)
+                     for tag_id, bitmap in self._bitmaps.items() if tag_id in self._tags]
+        facets = []
+        for tag, bitmap in items:
+            count = (bitmap if within is None else bitmap & within).bit_count()
+            if count:
+                facets.append(dict(tag, count=count))
+        facets.sort(key=lambda facet: (-facet['count'], facet['name']))
+        return facets
+
+
+tag_index = TagIndex()
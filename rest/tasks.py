@@ -0,0 +1,43 @@
+# rest/tasks.py
+import logging
+
+from PIL import UnidentifiedImageError
+
+from . import related
+from .images import extract_metadata
+from .jobs import task
+from .models import ContentImage
+
+logger = logging.getLogger(__name__)
+
+
+@task(priority=10)
+def process_content_image(image_id):
+    """Store dimensions, size, BlurHash and dominant colour of an uploaded image."""
+    image = ContentImage.objects.filter(pk=image_id).first()
+    if image is None or not image.image:
+        return
+    try:
+        with image.image.open('rb') as fh:
+            metadata = extract_metadata(fh)
+    except (UnidentifiedImageError, OSError, SyntaxError):
+        logger.warning("ContentImage %s has an unreadable file: %s", image_id, image.image.name)
+        return
+    # update() rather than save() so post_save doesn't queue this job again
+    ContentImage.objects.filter(pk=image_id, image=image.image.name).update(**metadata)
+
+
+@task
+def update_related_content(content_ids):
+    """Rewrite the related-content lists affected by a change to the tags of ``content_ids``."""
+    related.update(content_ids)
+
+
+@task
+def refresh_related_content(content_ids):
+    related.refresh(content_ids)
+
+
+@task(priority=-10)
+def rebuild_related_content():
+    related.rebuild()
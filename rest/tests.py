@@ -1,3 +1,888 @@
-from django.test import TestCase
+import io
+import json
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import db_router, jobs, metrics, profiling, related, throttling
+from .images import blurhash, dominant_color, extract_metadata
+from .models import (
+    Content, ContentImage, ContentText, Job, MediaBlob, Page, ProfilingRule, RelatedContent, Tag,
+)
+from .tag_index import TagIndex, current_generation, from_bitmap, tag_index
+from .tasks import process_content_image
+from .tree import MAX_DEPTH
+from .views import filter_by_tags
+
+
+REPLICA = 'replica_1'
+HAS_REPLICA = REPLICA in settings.DATABASES
+
+
+def isolate_requests(test):
+    """
+    Per-process request state for ``test``: ProfilingMiddleware doesn't reload
+    its rules (an extra query), reads don't go to a replica, which can't
+    see the test's uncommitted rows, and throttles, metrics and profile
+    captures start from fresh directories.
+    """
+    patcher = mock.patch.dict(profiling._rules, loaded_at=float('inf'), rules=[])
+    patcher.start()
+    test.addCleanup(patcher.stop)
+    var_dir = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, var_dir)
+    override = override_settings(
+        DATABASE_REPLICAS={},
+        THROTTLE_STATE_DIR=os.path.join(var_dir, 'throttle'),
+        METRICS_DIR=os.path.join(var_dir, 'metrics'),
+        PROFILE_CAPTURE_DIR=os.path.join(var_dir, 'profiles'),
+    )
+    override.enable()
+    test.addCleanup(override.disable)
+
+
+def temporary_media_root(test):
+    media_root = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, media_root)
+    override = override_settings(MEDIA_ROOT=media_root)
+    override.enable()
+    test.addCleanup(override.disable)
+
+
+class AdminPerformanceModeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw')
+        page = Page.objects.create(title='Page', slug='page')
+        tags = [Tag.objects.create(name=f'Tag {i}', slug=f'tag-{i}') for i in range(3)]
+        for i in range(30):
+            content = Content.objects.create(title=f'Content {i}', slug=f'content-{i}', page=page)
+            content.tags.set(tags)
+            ContentImage.objects.create(content=content, order=0)
+            ContentText.objects.create(content=content, text='text', order=0)
+
+    def setUp(self):
+        isolate_requests(self)
+        self.client.force_login(self.user)
+
+    def get_changelist(self, model):
+        response = self.client.get(reverse(f'admin:rest_{model}_changelist'))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    @override_settings(ADMIN_PERFORMANCE_MODE=True)
+    def test_changelist_queries(self):
+        # session, user, count, rows with their page, tags prefetch
+        with self.assertNumQueries(5):
+            self.get_changelist('content')
+        with self.assertNumQueries(4):
+            self.get_changelist('contentimage')
+        with self.assertNumQueries(4):
+            self.get_changelist('contenttext')
+
+    @override_settings(ADMIN_PERFORMANCE_MODE=False)
+    def test_changelist_queries_without_performance_mode(self):
+        # one tags query per row and every page/tag listed in the sidebar
+        with CaptureQueriesContext(connection) as queries:
+            self.get_changelist('content')
+        self.assertGreater(len(queries), 30)
+
+
+class TagIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.news = Tag.objects.create(name='News', slug='news')
+        cls.sport = Tag.objects.create(name='Sport', slug='sport')
+        cls.contents = [Content.objects.create(title=f'Content {i}', slug=f'content-{i}')
+                        for i in range(4)]
+
+    def setUp(self):
+        # the index is module state; drop whatever earlier tests left in it
+        tag_index.rebuild()
+
+    def matching(self, *slugs, operator='or'):
+        return from_bitmap(tag_index.match(slugs, operator))
+
+    def test_forward_and_reverse_changes(self):
+        first, second, third, _ = self.contents
+        with self.captureOnCommitCallbacks(execute=True):
+            first.tags.add(self.news, self.sport)
+            self.news.contents.add(second, third)
+        self.assertEqual(self.matching('news'), [first.pk, second.pk, third.pk])
+        self.assertEqual(self.matching('news', 'sport', operator='and'), [first.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.tags.remove(self.news)
+            self.news.contents.remove(third)
+        self.assertEqual(self.matching('news'), [second.pk])
+        self.assertEqual(self.matching('sport'), [first.pk])
+
+    def test_clear_and_delete(self):
+        first, second, third, _ = self.contents
+        with self.captureOnCommitCallbacks(execute=True):
+            self.news.contents.add(first, second, third)
+            self.sport.contents.add(first)
+        with self.captureOnCommitCallbacks(execute=True):
+            first.tags.clear()
+            third.delete()
+        self.assertEqual(self.matching('news', 'sport'), [second.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.news.contents.clear()
+        self.assertEqual(self.matching('news'), [])
+
+    def test_other_index_sees_changes(self):
+        # another worker's index, built before the change
+        other = TagIndex()
+        self.assertEqual(other.match(['news']), 0)
+        generation = current_generation()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.contents[0].tags.add(self.news)
+        self.assertEqual(current_generation(), generation + 1)
+        self.assertEqual(from_bitmap(other.match(['news'])), [self.contents[0].pk])
+
+    def test_filter_by_tags_without_id_list(self):
+        first, second, third, _ = self.contents
+        with self.captureOnCommitCallbacks(execute=True):
+            self.news.contents.add(first, second)
+            self.sport.contents.add(second, third)
+        queryset = Content.objects.order_by('pk')
+        for operator, expected in (('or', [first, second, third]), ('and', [second])):
+            for max_ids in (1000, 1):
+                with self.subTest(operator=operator, max_ids=max_ids), \
+                        override_settings(TAG_FILTER_MAX_IDS=max_ids):
+                    self.assertEqual(list(filter_by_tags(queryset, (['news', 'sport'], operator))),
+                                     expected)
+
+
+calls = []
+
+
+@jobs.task(max_attempts=2)
+def record_call(value):
+    calls.append(value)
+
+
+@jobs.task(max_attempts=2)
+def always_fail():
+    raise RuntimeError('boom')
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def expire(self, job):
+        Job.objects.filter(pk=job.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+
+    def test_enqueue_dedupes_queued_jobs(self):
+        job = record_call.enqueue(1, dedupe_key='one')
+        self.assertEqual(record_call.enqueue(1, dedupe_key='one'), job)
+        self.assertNotEqual(record_call.enqueue(1), job)
+
+    def test_claim_order_and_exclusivity(self):
+        low = record_call.enqueue('low')
+        high = record_call.enqueue('high', priority=5)
+        record_call.enqueue('later', delay=60)
+        self.assertEqual(jobs.claim('a', 1), [high.pk])
+        self.assertEqual(jobs.claim('b', 5), [low.pk])
+        self.assertEqual(jobs.claim('c', 5), [])
+
+    def test_run_job(self):
+        job = record_call.enqueue('x')
+        jobs.claim('a', 1)
+        self.assertIsNone(jobs.run_job(job.pk, 'b'))
+        self.assertTrue(jobs.run_job(job.pk, 'a'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, calls), ('done', 1, ['x']))
+
+    def test_retry_then_fail(self):
+        job = always_fail.enqueue()
+        jobs.claim('a', 1)
+        with self.assertLogs('rest.jobs', 'WARNING'):
+            self.assertFalse(jobs.run_job(job.pk, 'a'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'queued')
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn('RuntimeError: boom', job.last_error)
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        self.assertEqual(jobs.claim('a', 1), [job.pk])
+        with self.assertLogs('rest.jobs', 'WARNING'):
+            self.assertFalse(jobs.run_job(job.pk, 'a'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_visibility_timeout(self):
+        job = record_call.enqueue('x')
+        jobs.claim('dead', 1)
+        self.assertEqual(jobs.claim('b', 1), [])
+        self.expire(job)
+        self.assertEqual(jobs.claim('b', 1), [job.pk])
+        # the first worker lost the job and must not finish it
+        self.assertIsNone(jobs.run_job(job.pk, 'dead'))
+        self.assertTrue(jobs.run_job(job.pk, 'b'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, calls), ('done', 2, ['x']))
+
+    def test_visibility_timeout_on_last_attempt(self):
+        job = record_call.enqueue('x')
+        for _ in range(job.max_attempts):
+            self.assertEqual(jobs.claim('dead', 1), [job.pk])
+            self.expire(job)
+        self.assertEqual(jobs.claim('b', 1), [])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+        self.assertIn('Visibility timeout', job.last_error)
+        self.assertEqual(calls, [])
+
+    def test_concurrent_enqueue(self):
+        # another worker inserts the same key between the check and the insert
+        other = record_call.enqueue(1, dedupe_key='one')
+        with mock.patch('django.db.models.query.QuerySet.first', side_effect=[None, other]):
+            self.assertEqual(record_call.enqueue(1, dedupe_key='one'), other)
+        self.assertEqual(Job.objects.filter(dedupe_key='one').count(), 1)
+
+    def test_retry_when_key_queued_again(self):
+        job = always_fail.enqueue(dedupe_key='key')
+        jobs.claim('a', 1)
+        newer = always_fail.enqueue(dedupe_key='key')
+        self.assertNotEqual(newer, job)
+        with self.assertLogs('rest.jobs', 'WARNING'):
+            jobs.run_job(job.pk, 'a')
+        self.assertEqual(Job.objects.get(pk=job.pk).status, 'failed')
+        self.assertEqual(Job.objects.get(pk=newer.pk).status, 'queued')
+
+    def test_worker_survives_runner_errors(self):
+        first, second = record_call.enqueue(1), record_call.enqueue(2)
+        out = io.StringIO()
+        with mock.patch.object(jobs, 'run_job', side_effect=[DatabaseError('gone'), True]) as run_job, \
+                mock.patch('signal.signal'), \
+                self.assertLogs('rest.management.commands.run_jobs', 'ERROR'):
+            call_command('run_jobs', '--burst', '--concurrency', '1', stdout=out)
+        self.assertEqual([call.args[0] for call in run_job.call_args_list], [first.pk, second.pk])
+        self.assertIn('1 done', out.getvalue())
+
+
+class MediaRefcountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.content = Content.objects.create(title='Content', slug='content')
+
+    def setUp(self):
+        temporary_media_root(self)
+
+    def upload(self, data, name='photo.JPG'):
+        return SimpleUploadedFile(name, data, content_type='image/jpeg')
+
+    def add_image(self, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return ContentImage.objects.create(content=self.content, image=self.upload(data))
+
+    def refcounts(self):
+        return dict(MediaBlob.objects.values_list('name', 'refcount'))
+
+    def sweep(self, **options):
+        call_command('sweep_media', stdout=io.StringIO(), **options)
+
+    def test_same_bytes_stored_once(self):
+        first, second = self.add_image(b'one'), self.add_image(b'one')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r'^content_images/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        self.assertEqual(self.refcounts(), {first.image.name: 2})
+
+    def test_replace_and_delete(self):
+        first, second = self.add_image(b'one'), self.add_image(b'one')
+        shared = first.image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            first.image = self.upload(b'two')
+            first.save()
+        self.assertEqual(self.refcounts(), {shared: 1, first.image.name: 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+            first.delete()
+        self.assertEqual(self.refcounts(), {shared: 0, first.image.name: 0})
+
+    def test_sweep(self):
+        kept, dropped = self.add_image(b'kept'), self.add_image(b'dropped')
+        name = dropped.image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            dropped.delete()
+        # still inside the grace period
+        self.sweep()
+        self.assertTrue(default_storage.exists(name))
+
+        MediaBlob.objects.filter(name=name).update(referenced_at=timezone.now() - timedelta(days=2))
+        MediaBlob.objects.filter(name=kept.image.name).update(refcount=5)
+        orphan = default_storage.path('content_images/ab/' + 'ab' * 32 + '.jpg')
+        os.makedirs(os.path.dirname(orphan))
+        with open(orphan, 'wb') as fh:
+            fh.write(b'orphan')
+        os.utime(orphan, (0, 0))
+
+        self.sweep()
+        self.assertEqual(self.refcounts(), {kept.image.name: 1})
+        self.assertTrue(default_storage.exists(kept.image.name))
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(os.path.exists(orphan))
+
+
+class PageSubtreeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.root = Page.objects.create(title='Root', slug='root')
+        cls.child = Page.objects.create(title='Child', slug='child', parent=cls.root)
+        cls.hidden = Page.objects.create(title='Hidden', slug='hidden', parent=cls.child,
+                                         is_published=False)
+        cls.below_hidden = Page.objects.create(title='Below', slug='below', parent=cls.hidden)
+        cls.other = Page.objects.create(title='Other', slug='other')
+        tag = Tag.objects.create(name='News', slug='news')
+        for page in (cls.root, cls.child, cls.hidden, cls.below_hidden, cls.other):
+            for i in range(2):
+                content = Content.objects.create(title=f'{page.slug} {i}', slug=f'{page.slug}-{i}',
+                                                 page=page)
+                content.tags.add(tag)
+
+    def setUp(self):
+        isolate_requests(self)
+
+    def get_titles(self, page):
+        response = self.client.get(reverse('page-subtree', args=[page.pk]))
+        self.assertEqual(response.status_code, 200)
+        return [content['title'] for content in response.json()['results']]
+
+    def test_strategies(self):
+        expected = ['child 0', 'child 1', 'root 0', 'root 1']
+        # page, count, contents, tags, images; the path strategy reads the
+        # descendants' paths first
+        for strategy, queries in (('cte', 5), ('path', 6)):
+            with self.subTest(strategy=strategy), override_settings(PAGE_SUBTREE_STRATEGY=strategy):
+                with self.assertNumQueries(queries):
+                    self.assertEqual(self.get_titles(self.root), expected)
+                self.assertEqual(self.get_titles(self.hidden), ['below 0', 'below 1', 'hidden 0', 'hidden 1'])
+
+    def test_deepest_tree(self):
+        parent, pages = None, []
+        for depth in range(MAX_DEPTH + 1):
+            parent = Page.objects.create(title=f'Level {depth}', slug=f'level-{depth}', parent=parent)
+            pages.append(parent)
+        self.assertGreater(len(pages[-1].path), 1000)
+        Content.objects.create(title='Deepest', slug='deepest', page=pages[-1])
+        for strategy in ('cte', 'path'):
+            with self.subTest(strategy=strategy), override_settings(PAGE_SUBTREE_STRATEGY=strategy):
+                self.assertEqual(self.get_titles(pages[0]), ['Deepest'])
+
+    def test_path_follows_moves(self):
+        self.child.parent = self.other
+        self.child.save()
+        for strategy in ('cte', 'path'):
+            with self.subTest(strategy=strategy), override_settings(PAGE_SUBTREE_STRATEGY=strategy):
+                self.assertEqual(self.get_titles(self.root), ['root 0', 'root 1'])
+                self.assertEqual(self.get_titles(self.other),
+                                 ['child 0', 'child 1', 'other 0', 'other 1'])
+        self.assertTrue(Page.objects.get(pk=self.below_hidden.pk).path.startswith(
+            f'/{self.other.pk.hex}/{self.child.pk.hex}/'))
+
+
+@override_settings(RELATED_CONTENT_TOP_K=3)
+class RelatedContentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tags = [Tag.objects.create(name=f'Tag {i}', slug=f'tag-{i}') for i in range(6)]
+        cls.contents = [Content.objects.create(title=f'Content {i}', slug=f'content-{i}')
+                        for i in range(12)]
+        rng = random.Random(1)
+        start = timezone.now() - timedelta(days=400)
+        for i, content in enumerate(cls.contents):
+            content.tags.set(rng.sample(cls.tags, rng.randint(1, 3)))
+            # one content without a date
+            created_at = None if i == 5 else start + timedelta(days=rng.randint(0, 400))
+            Content.objects.filter(pk=content.pk).update(created_at=created_at)
+
+    def setUp(self):
+        isolate_requests(self)
+
+    def stored(self):
+        return list(RelatedContent.objects.values_list('content_id', 'rank', 'related_id', 'score'))
+
+    def assertMatchesRebuild(self):
+        incremental = self.stored()
+        related.rebuild()
+        self.assertEqual(incremental, self.stored())
+
+    def test_incremental_updates_match_rebuild(self):
+        related.rebuild()
+        rng = random.Random(2)
+        for _ in range(25):
+            content, tag = rng.choice(self.contents), rng.choice(self.tags)
+            if content.tags.filter(pk=tag.pk).exists():
+                content.tags.remove(tag)
+            else:
+                content.tags.add(tag)
+            related.update([content.pk])
+            self.assertMatchesRebuild()
+
+    def test_bulk_update_matches_rebuild(self):
+        related.rebuild()
+        changed = self.contents[:5]
+        self.tags[0].contents.add(*changed)
+        related.update([content.pk for content in changed])
+        self.assertMatchesRebuild()
+
+    @override_settings(RELATED_CONTENT_TOP_K=1)
+    def test_incremental_updates_with_ties(self):
+        # undated contents all have recency 0: equal scores, lower id wins
+        tag = Tag.objects.create(name='Tied', slug='tied')
+        first, second, third = [Content.objects.create(title=f'Tied {i}', slug=f'tied-{i}')
+                                for i in range(3)]
+        Content.objects.filter(pk__in=[first.pk, second.pk, third.pk]).update(created_at=None)
+        first.tags.set([tag])
+        third.tags.set([tag])
+        related.rebuild()
+        second.tags.set([tag])
+        related.update([second.pk])
+        self.assertEqual(RelatedContent.objects.get(content=first).related_id, second.pk)
+        self.assertMatchesRebuild()
+
+    def test_refresh_after_delete(self):
+        related.rebuild()
+        deleted = RelatedContent.objects.first().related
+        affected = list(RelatedContent.objects.filter(related=deleted)
+                        .exclude(content=deleted).values_list('content_id', flat=True))
+        deleted.delete()
+        related.refresh(affected)
+        self.assertMatchesRebuild()
+
+    @override_settings(RELATED_CONTENT_HALF_LIFE_DAYS=0.5)
+    def test_short_half_life(self):
+        related.rebuild()
+        response = self.client.get(reverse('content-related', args=[self.contents[0].pk]))
+        self.assertEqual(response.status_code, 200)
+        for entry in response.json():
+            self.assertGreaterEqual(entry['score'], 0)
+            self.assertLessEqual(entry['score'], 1)
+
+    def test_score(self):
+        content, other = self.contents[:2]
+        content.tags.set(self.tags[:2])
+        other.tags.set(self.tags[1:2])
+        Content.objects.filter(pk=other.pk).update(
+            created_at=timezone.now() - timedelta(days=settings.RELATED_CONTENT_HALF_LIFE_DAYS))
+        related.rebuild()
+        entry = RelatedContent.objects.get(content=content, related=other)
+        # one shared tag of 2 and 1, one half-life old
+        self.assertAlmostEqual(related.display_score(entry.score, related.score_offset()),
+                               0.5 / math.sqrt(2), places=5)
+        self.assertEqual(related.recency(None), 0.0)
+
+    def test_tag_changes_queue_jobs(self):
+        Job.objects.all().delete()
+        small = Tag.objects.create(name='Small', slug='small')
+        large = Tag.objects.create(name='Large', slug='large')
+        content = self.contents[0]
+        # deduplicated while queued
+        content.tags.add(small)
+        content.tags.remove(small)
+        small.contents.add(*self.contents[:3])
+        with override_settings(RELATED_CONTENT_BULK_LIMIT=2):
+            large.contents.add(*self.contents[:3])
+        self.assertEqual(list(Job.objects.order_by('pk').values_list('name', 'args')), [
+            ('rest.tasks.update_related_content', [[content.pk]]),
+            ('rest.tasks.update_related_content', [sorted(c.pk for c in self.contents[:3])]),
+            ('rest.tasks.rebuild_related_content', []),
+        ])
+
+
+class WarmCacheTests(TransactionTestCase):
+    # the command requests from a worker thread, which has its own connection
+
+    def setUp(self):
+        isolate_requests(self)
+        self.page = Page.objects.create(title='Page', slug='page')
+        self.content = Content.objects.create(title='Content', slug='content', page=self.page)
+
+    def warm(self, *args):
+        out = io.StringIO()
+        call_command('warm_cache', '--json', '--concurrency', '1', *args, stdout=out)
+        return {result['url']: result['status'] for result in json.loads(out.getvalue())['results']}
+
+    @override_settings(ALLOWED_HOSTS=['.example.org', 'www.example.com'])
+    def test_host_and_report(self):
+        statuses = self.warm()
+        self.assertIn(f'/api/pages/{self.page.pk}/', statuses)
+        self.assertIn(f'/api/contents/{self.content.pk}/', statuses)
+        self.assertEqual(set(statuses.values()), {200})
+        # a host ALLOWED_HOSTS rejects
+        self.assertEqual(set(self.warm('--host', 'elsewhere.net').values()), {400})
+
+    @override_settings(ALLOWED_HOSTS=['example.org'])
+    def test_not_throttled(self):
+        with mock.patch.object(throttling.buckets, 'take', return_value=(False, 1.0)), \
+                mock.patch.object(throttling.limiter, 'acquire', return_value=None):
+            self.assertEqual(set(self.warm().values()), {200})
+
+    @override_settings(ALLOWED_HOSTS=['example.org'])
+    def test_failing_view_is_reported(self):
+        with mock.patch('rest.views.TagViewSet.list', side_effect=RuntimeError('boom')), \
+                self.assertLogs('django.request', 'ERROR'):
+            statuses = self.warm()
+        self.assertEqual(statuses.pop('/api/tags/'), 500)
+        self.assertEqual(set(statuses.values()), {200})
+
+
+@override_settings(DATABASE_REPLICAS={'a': 3, 'b': 1}, REPLICA_HEALTH_CHECK_INTERVAL=60)
+class ReplicaPoolTests(TestCase):
+    def test_weighted_round_robin(self):
+        pool = db_router.ReplicaPool()
+        with mock.patch.object(pool, 'check', return_value=True):
+            picks = [pool.choose() for _ in range(8)]
+        self.assertEqual(picks, ['a', 'a', 'b', 'a'] * 2)
+
+    def test_unhealthy_replica_skipped(self):
+        pool = db_router.ReplicaPool()
+        with mock.patch.object(pool, 'check', side_effect=lambda alias: alias == 'b') as check:
+            self.assertEqual({pool.choose() for _ in range(4)}, {'b'})
+            # verdicts are cached for REPLICA_HEALTH_CHECK_INTERVAL
+            self.assertEqual(check.call_count, 2)
+        with mock.patch.object(pool, 'check', return_value=False):
+            self.assertEqual(pool.choose(), 'b')
+        with override_settings(REPLICA_HEALTH_CHECK_INTERVAL=0), \
+                mock.patch.object(pool, 'check', return_value=False):
+            self.assertIsNone(pool.choose())
+
+
+@unittest.skipUnless(HAS_REPLICA, 'needs DB_REPLICAS')
+class ReplicaRoutingTests(TestCase):
+    databases = {'default', REPLICA} if HAS_REPLICA else {'default'}
+
+    def setUp(self):
+        isolate_requests(self)
+        override = override_settings(DATABASE_REPLICAS={REPLICA: 1})
+        override.enable()
+        self.addCleanup(override.disable)
+        patcher = mock.patch.object(db_router, 'pool', db_router.ReplicaPool())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.staff = get_user_model().objects.create_user('staff', password='pw', is_staff=True)
+
+    def queries_by_alias(self, method, url, **kwargs):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections[REPLICA]) as replica:
+            response = getattr(self.client, method)(url, **kwargs)
+        self.assertLess(response.status_code, 400)
+        return response, len(primary), len(replica)
+
+    def test_safe_api_read_uses_replica(self):
+        _, primary, replica = self.queries_by_alias('get', '/api/tags/')
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_write_pins_client_to_primary(self):
+        self.client.force_login(self.staff)
+        response, _, replica = self.queries_by_alias(
+            'post', '/api/tags/', data={'name': 'News', 'slug': 'news'})
+        self.assertEqual(replica, 0)
+        pinned_until = float(response.cookies[settings.REPLICA_PIN_COOKIE].value)
+        self.assertGreater(pinned_until, time.time())
+        # the cookie is sent back: the next read stays on the primary
+        _, primary, replica = self.queries_by_alias('get', '/api/tags/')
+        self.assertEqual(replica, 0)
+        self.assertGreater(primary, 0)
+
+    def test_expired_pin_uses_replica(self):
+        self.client.cookies[settings.REPLICA_PIN_COOKIE] = str(time.time() - 1)
+        _, _, replica = self.queries_by_alias('get', '/api/tags/')
+        self.assertGreater(replica, 0)
+
+    def test_admin_uses_primary(self):
+        self.client.force_login(self.staff)
+        self.staff.is_superuser = True
+        self.staff.save()
+        _, _, replica = self.queries_by_alias('get', reverse('admin:rest_tag_changelist'))
+        self.assertEqual(replica, 0)
+
+    def test_failed_health_check_skips_replica(self):
+        with mock.patch.object(db_router.pool, 'check', return_value=False):
+            _, primary, replica = self.queries_by_alias('get', '/api/tags/')
+        self.assertEqual(replica, 0)
+        self.assertGreater(primary, 0)
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', ''])
+    process.wait()
+    return process.pid
+
+
+class MetricsTests(TestCase):
+    route = 'TagViewSet.list\tGET'
+
+    def setUp(self):
+        isolate_requests(self)
+        self.collector = metrics.Collector()
+
+    def write(self, filename, sql_queries):
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        row = [0] * (len(metrics.QUERY_BUCKETS) + 1) + [0.0]
+        for count in sql_queries:
+            row[metrics.QUERY_BUCKETS.index(count)] += 1
+            row[-1] += count
+        series = {'http_request_sql_queries': {self.route: row}, 'unknown': {}}
+        with open(os.path.join(settings.METRICS_DIR, filename), 'w') as fh:
+            json.dump(series, fh)
+
+    def sql_queries(self):
+        return self.collector.collect()['http_request_sql_queries'][self.route]
+
+    def test_merge_worker_files(self):
+        timings = metrics.RequestTimings()
+        timings.sql_count = 5
+        self.collector.observe_request('TagViewSet.list', 'GET', 0.1, timings, 10)
+        live = f'{os.getppid()}-a.json'
+        dead = f'{dead_pid()}-b.json'
+        self.write(live, [1, 2])
+        self.write(dead, [2, 10])
+        expected = [0, 1, 2, 1, 1, 0, 0, 0, 0, 0, 20.0]
+        self.assertEqual(self.sql_queries(), expected)
+        # the dead worker's counts live on in the aggregate, the live one's file stays
+        files = sorted(os.listdir(settings.METRICS_DIR))
+        self.assertIn(live, files)
+        self.assertNotIn(dead, files)
+        self.assertIn(metrics.Collector.AGGREGATE, files)
+        self.assertEqual(self.sql_queries(), expected)
+
+        self.write(f'{dead_pid()}-c.json', [0])
+        expected[0] += 1
+        self.assertEqual(self.sql_queries(), expected)
+        self.assertEqual(len(os.listdir(settings.METRICS_DIR)), 4)  # live, own, aggregate, lock
+        self.assertIn(
+            'http_request_sql_queries_count{route="TagViewSet.list",method="GET"} 6',
+            self.collector.render())
+
+    def test_server_timing_for_staff_only(self):
+        self.assertNotIn('Server-Timing', self.client.get('/api/tags/'))
+        self.client.force_login(get_user_model().objects.create_user('user'))
+        self.assertNotIn('Server-Timing', self.client.get('/api/tags/'))
+        self.client.force_login(get_user_model().objects.create_user('staff', is_staff=True))
+        header = self.client.get('/api/tags/')['Server-Timing']
+        self.assertRegex(header, r'^sql;dur=[\d.]+;desc="\d+ queries", .*total;dur=[\d.]+$')
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        isolate_requests(self)
+        self.client.force_login(get_user_model().objects.create_user('user'))
+
+    def enable(self, mode):
+        ProfilingRule.objects.create(route='TagViewSet.list', mode=mode, sample_rate=100,
+                                     threshold_ms=0, is_enabled=True)
+        # reload on the next request, which must then list the reload query too
+        profiling._rules['loaded_at'] = -math.inf
+
+    def assert_capture(self, mode, artifact):
+        self.enable(mode)
+        self.assertEqual(self.client.get('/api/tags/').status_code, 200)
+        [meta] = profiling.captures.all()
+        self.assertEqual((meta['route'], meta['mode'], meta['status']), ('TagViewSet.list', mode, 200))
+        self.assertGreater(meta['sql_count'], 0)
+        self.assertEqual(meta['sql_count'], len(meta['queries']))
+        self.assertEqual(meta['artifacts'], [artifact])
+        self.assertIsNotNone(profiling.captures.artifact_path(meta['id'], artifact))
+        # other routes aren't profiled
+        self.client.get('/api/contents/')
+        self.assertEqual(len(profiling.captures.ids()), 1)
+
+    def test_sampling_capture(self):
+        self.assert_capture('sampling', 'folded')
+
+    def test_deterministic_capture(self):
+        self.assert_capture('deterministic', 'pstats')
+
+    @override_settings(PROFILE_CAPTURE_LIMIT=2)
+    def test_prune(self):
+        self.enable('sampling')
+        for _ in range(4):
+            self.client.get('/api/tags/')
+        self.assertEqual(len(profiling.captures.ids()), 2)
+        self.assertEqual(len(os.listdir(settings.PROFILE_CAPTURE_DIR)), 4)
+
+
+class ThrottlingTests(TestCase):
+    def setUp(self):
+        isolate_requests(self)
+        self.now = 1000.0
+        patcher = mock.patch('rest.throttling.time.time', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def rates(self, **rates):
+        return override_settings(REST_FRAMEWORK=dict(settings.REST_FRAMEWORK,
+                                                     DEFAULT_THROTTLE_RATES=rates))
+
+    def test_token_bucket(self):
+        store = throttling.BucketStore('test.bin', 64)
+        self.assertEqual([store.take('key', 1.0, 2)[0] for _ in range(3)], [True, True, False])
+        self.assertEqual(store.take('key', 1.0, 2), (False, 1.0))
+        # other keys have their own bucket
+        self.assertTrue(store.take('other', 1.0, 2)[0])
+        self.now += 1
+        self.assertEqual([store.take('key', 1.0, 2)[0] for _ in range(2)], [True, False])
+        # refill stops at the burst
+        self.now += 60
+        self.assertEqual([store.take('key', 1.0, 2)[0] for _ in range(3)], [True, True, False])
+
+    def test_api_throttle(self):
+        with self.rates(ip='2/m'):
+            statuses = [self.client.get('/api/tags/').status_code for _ in range(3)]
+            self.assertEqual(statuses, [200, 200, 429])
+            response = self.client.get('/api/tags/')
+            self.assertEqual(response['Retry-After'], '30')
+            internal = self.client.get('/api/tags/', **{throttling.INTERNAL_REQUEST_KEY: True})
+            self.assertEqual(internal.status_code, 200)
+            self.client.force_login(get_user_model().objects.create_user('staff', is_staff=True))
+            self.assertEqual(self.client.get('/api/tags/').status_code, 200)
+
+    def test_route_throttle(self):
+        with self.rates(**{'TagViewSet.list': '1/m'}):
+            self.assertEqual(self.client.get('/api/tags/').status_code, 200)
+            self.assertEqual(self.client.get('/api/tags/').status_code, 429)
+            self.assertEqual(self.client.get('/api/contents/').status_code, 200)
+
+    @override_settings(CONCURRENCY_MAX_LIMIT=2, CONCURRENCY_MIN_LIMIT=1)
+    def test_shedding(self):
+        limiter = throttling.limiter
+        slots = [limiter.acquire(), limiter.acquire()]
+        self.assertIsNone(limiter.acquire())
+        response = self.client.get('/api/tags/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        # only CONCURRENCY_LIMIT_PATHS are limited
+        self.assertNotEqual(self.client.get('/metrics').status_code, 503)
+        for slot in slots:
+            limiter.release(slot, 0.1)
+        self.assertEqual(self.client.get('/api/tags/').status_code, 200)
+
+    @override_settings(CONCURRENCY_MAX_LIMIT=10, CONCURRENCY_MIN_LIMIT=2,
+                       CONCURRENCY_TARGET_LATENCY=0.5, CONCURRENCY_BACKOFF=0.5)
+    def test_limit_backoff(self):
+        limiter = throttling.limiter
+
+        def limit():
+            with limiter.locked() as table:
+                return limiter._header(table)[0]
+
+        limiter.release(limiter.acquire(), 2.0)
+        self.assertEqual(limit(), 5)
+        limiter.release(limiter.acquire(), 2.0)
+        limiter.release(limiter.acquire(), 2.0)
+        self.assertEqual(limit(), 2)
+        limiter.release(limiter.acquire(), 0.1)
+        self.assertEqual(limit(), 2.5)
+
+    @override_settings(CONCURRENCY_MAX_LIMIT=1, CONCURRENCY_MIN_LIMIT=1, CONCURRENCY_STALE_SECONDS=60)
+    def test_stale_slot_release(self):
+        limiter = throttling.limiter
+        stuck = limiter.acquire()
+        self.assertIsNone(limiter.acquire())
+        self.now += 61
+        current = limiter.acquire()
+        self.assertEqual(current[0], stuck[0])
+        # the stuck request finishing must not free the new request's entry
+        limiter.release(stuck, 61.0)
+        self.assertIsNone(limiter.acquire())
+        limiter.release(current, 0.1)
+        self.assertIsNotNone(limiter.acquire())
+
+
+def image_bytes(size=(40, 20), color=(200, 30, 30), format='PNG', **save_options):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, format, **save_options)
+    return buffer.getvalue()
+
+
+class ImageMetadataTests(TestCase):
+    def test_blurhash_reference_vector(self):
+        # expected values from the reference blurhash package
+        image = Image.new('RGB', (8, 6))
+        image.putdata([(x * 32, y * 40, 255 - x * 16 - y * 20) for y in range(6) for x in range(8)])
+        self.assertEqual(blurhash(image), 'LrF=a:7jb2xvzlRsfTnVevfAfRf9')
+        self.assertEqual(blurhash(image, 3, 3), 'KrF=a:7jb2zlRsfTevfAfR')
+
+    def test_dominant_color(self):
+        image = Image.new('RGB', (10, 10), (0, 0, 255))
+        image.paste((255, 128, 0), (0, 0, 10, 7))
+        self.assertEqual(dominant_color(image), '#ff8000')
+
+    def test_extract_metadata(self):
+        data = image_bytes((40, 20), format='PNG')
+        metadata = extract_metadata(io.BytesIO(data))
+        self.assertEqual((metadata['width'], metadata['height'], metadata['byte_size']),
+                         (40, 20, len(data)))
+        self.assertEqual(metadata['dominant_color'], '#c81e1e')
+        self.assertEqual(len(metadata['placeholder']), 28)
+
+    def test_exif_rotation(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # orientation: rotate 90 degrees clockwise
+        metadata = extract_metadata(io.BytesIO(image_bytes((40, 20), format='JPEG', exif=exif)))
+        self.assertEqual((metadata['width'], metadata['height']), (20, 40))
+        self.assertRegex(metadata['dominant_color'], r'^#[0-9a-f]{6}$')
+
+
+class ContentImageProcessingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.content = Content.objects.create(title='Content', slug='content')
+
+    def setUp(self):
+        temporary_media_root(self)
+
+    def upload(self, **kwargs):
+        return SimpleUploadedFile('photo.png', image_bytes(**kwargs), content_type='image/png')
+
+    def queued(self):
+        return Job.objects.filter(name=process_content_image.job_name, status='queued').count()
+
+    def test_queuing(self):
+        image = ContentImage.objects.create(content=self.content, image=self.upload())
+        job = Job.objects.get(dedupe_key=f'content-image:{image.pk}')
+        self.assertEqual(job.args, [image.pk])
+        # saved again before the job ran: still one job
+        image.text = 'caption'
+        image.save()
+        self.assertEqual(self.queued(), 1)
+
+        process_content_image(image.pk)
+        Job.objects.update(status='done')
+        image.refresh_from_db()
+        self.assertEqual((image.width, image.height), (40, 20))
+        self.assertTrue(image.placeholder)
+
+        # a plain save of a processed image queues nothing
+        image.text = 'other caption'
+        image.save()
+        self.assertEqual(self.queued(), 0)
+        # a new upload does
+        image.image = self.upload(size=(10, 10), color=(0, 0, 0))
+        image.save()
+        self.assertEqual(self.queued(), 1)
@@ -0,0 +1,257 @@
+# rest/throttling.py
+"""
+Rate limiting shared by every worker process on a host.
+
+State lives in small memory-mapped files under THROTTLE_STATE_DIR, guarded by
+``flock``, so gunicorn/uvicorn workers see the same buckets and the same
+in-flight count without a cache server.
+
+- ``IPThrottle`` / ``RouteThrottle``: DRF token-bucket throttles (429).
+- ``ConcurrencyLimiter``: AIMD limit on requests in flight, used by
+  ``rest.middleware.ConcurrencyLimitMiddleware`` to shed load (503).
+"""
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+# WSGI environ key marking requests made by the app itself (warm_cache). It
+# can't be set from outside: HTTP headers only reach the environ as HTTP_*.
+INTERNAL_REQUEST_KEY = 'rest.internal_request'
+
+
+def is_internal(request):
+    return bool(request.META.get(INTERNAL_REQUEST_KEY))
+
+
+def parse_rate(rate):
+    """``'20/s'`` -> (refill per second, burst). The burst is the request count."""
+    if not rate:
+        return None
+    count, period = rate.split('/')
+    count = int(count)
+    return count / PERIODS[period[0]], count
+
+
+class SharedFile:
+    """
+    A fixed-size file mapped into memory. Each process opens its own
+    descriptor (flock locks belong to the open file, which fork would share)
+    and threads in a process take turns on a local lock first. The file is
+    reopened if THROTTLE_STATE_DIR changes.
+    """
+
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+        self._pid = None
+        self._path = None
+        self._thread_lock = threading.Lock()
+
+    def _open(self, path):
+        if self._pid == os.getpid():
+            self._map.close()
+            os.close(self._fd)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(fd).st_size < self.size:
+            os.ftruncate(fd, self.size)
+        self._fd = fd
+        self._map = mmap.mmap(fd, self.size)
+        self._pid = os.getpid()
+        self._path = path
+
+    @contextmanager
+    def locked(self):
+        path = os.path.join(str(settings.THROTTLE_STATE_DIR), self.name)
+        with self._thread_lock:
+            if self._pid != os.getpid() or self._path != path:
+                self._open(path)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield self._map
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+class BucketStore(SharedFile):
+    """
+    Open-addressed table of token buckets: (key hash, tokens, last refill).
+    A key takes the first free or matching slot among PROBES neighbours;
+    when all are taken the least recently used bucket is replaced.
+    """
+    SLOT = struct.Struct('=Qdd')
+    PROBES = 8
+
+    def __init__(self, name, slots):
+        super().__init__(name, slots * self.SLOT.size)
+        self.slots = slots
+
+    def take(self, key, rate, burst):
+        """Take one token from ``key``'s bucket. Returns (allowed, seconds until one is available)."""
+        key_hash = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little') | 1
+        start = key_hash % self.slots
+        now = time.time()
+        with self.locked() as table:
+            slot = None
+            oldest = None
+            for probe in range(self.PROBES):
+                offset = (start + probe) % self.slots * self.SLOT.size
+                stored_hash, tokens, updated = self.SLOT.unpack_from(table, offset)
+                if stored_hash == key_hash:
+                    slot = offset
+                    break
+                if stored_hash == 0:
+                    updated = -1.0
+                if oldest is None or updated < oldest[1]:
+                    oldest = (offset, updated)
+            if slot is None:
+                slot, tokens, updated = oldest[0], burst, now
+            tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self.SLOT.pack_into(table, slot, key_hash, tokens, now)
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+
+class ConcurrencyLimiter(SharedFile):
+    """
+    Counts requests in flight across processes and adapts the limit to
+    CONCURRENCY_TARGET_LATENCY: a slower response shrinks it by
+    CONCURRENCY_BACKOFF, a faster one grows it by 1/limit (AIMD).
+
+    Header: limit, EWMA latency. Then one (pid, started) entry per request in
+    flight; entries of workers that died mid-request expire after
+    CONCURRENCY_STALE_SECONDS.
+    """
+    HEADER = struct.Struct('=dd')
+    ENTRY = struct.Struct('=qd')
+    ENTRIES = 1024
+
+    def __init__(self, name):
+        super().__init__(name, self.HEADER.size + self.ENTRIES * self.ENTRY.size)
+
+    def _header(self, table):
+        limit, latency = self.HEADER.unpack_from(table, 0)
+        if limit == 0:
+            limit = float(settings.CONCURRENCY_MAX_LIMIT)
+        return limit, latency
+
+    def acquire(self):
+        """A slot to pass to ``release()`` if admitted, else None."""
+        now = time.time()
+        stale = now - settings.CONCURRENCY_STALE_SECONDS
+        with self.locked() as table:
+            limit, _ = self._header(table)
+            in_flight = 0
+            free = None
+            for index in range(self.ENTRIES):
+                offset = self.HEADER.size + index * self.ENTRY.size
+                pid, started = self.ENTRY.unpack_from(table, offset)
+                if pid and started < stale:
+                    self.ENTRY.pack_into(table, offset, 0, 0.0)
+                    pid = 0
+                if pid:
+                    in_flight += 1
+                elif free is None:
+                    free = index
+            if in_flight >= int(limit) or free is None:
+                return None
+            entry = (os.getpid(), now)
+            self.ENTRY.pack_into(table, self.HEADER.size + free * self.ENTRY.size, *entry)
+        return free, entry
+
+    def release(self, slot, latency):
+        target = settings.CONCURRENCY_TARGET_LATENCY
+        index, entry = slot
+        with self.locked() as table:
+            offset = self.HEADER.size + index * self.ENTRY.size
+            # a request that outlived CONCURRENCY_STALE_SECONDS may have lost
+            # its entry to another one; leave that in place
+            if self.ENTRY.unpack_from(table, offset) == entry:
+                self.ENTRY.pack_into(table, offset, 0, 0.0)
+            limit, average = self._header(table)
+            if latency > target:
+                limit *= settings.CONCURRENCY_BACKOFF
+            else:
+                limit += 1 / limit
+            limit = max(settings.CONCURRENCY_MIN_LIMIT, min(settings.CONCURRENCY_MAX_LIMIT, limit))
+            average = latency if average == 0 else average * 0.9 + latency * 0.1
+            self.HEADER.pack_into(table, 0, limit, average)
+
+    def retry_after(self):
+        """Whole seconds a shed client should wait: about one average response time."""
+        with self.locked() as table:
+            _, average = self._header(table)
+        return max(1, math.ceil(average))
+
+
+buckets = BucketStore('buckets.bin', settings.THROTTLE_SLOTS)
+limiter = ConcurrencyLimiter('concurrency.bin')
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Token bucket keyed by ``get_key()``, rate from
+    ``REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'][get_scope()]``. ``'20/s'``
+    refills 20 tokens a second and holds at most 20. Staff and internal
+    requests are not throttled.
+    """
+
+    def get_scope(self, request, view):
+        raise NotImplementedError
+
+    def get_key(self, request, view):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+        if is_internal(request) or (request.user and request.user.is_staff):
+            return True
+        scope = self.get_scope(request, view)
+        rate = parse_rate(api_settings.DEFAULT_THROTTLE_RATES.get(scope))
+        if rate is None:
+            return True
+        allowed, self.wait_seconds = buckets.take(self.get_key(request, view), *rate)
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class IPThrottle(TokenBucketThrottle):
+    """All API requests from one client address, scope ``ip``."""
+
+    def get_scope(self, request, view):
+        return 'ip'
+
+    def get_key(self, request, view):
+        return f"ip:{self.get_ident(request)}"
+
+
+class RouteThrottle(TokenBucketThrottle):
+    """
+    One client's requests to one route, scoped by ``PageViewSet.retrieve``-style
+    labels (or a view's ``throttle_scope``). Routes without a rate are free.
+    """
+
+    def get_scope(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if scope:
+            return scope
+        action = getattr(view, 'action', None) or request.method.lower()
+        return f"{view.__class__.__name__}.{action}"
+
+    def get_key(self, request, view):
+        return f"route:{self.get_scope(request, view)}:{self.get_ident(request)}"
@@ -0,0 +1,67 @@
+# rest/tree.py
+"""
+Page subtree lookups. A section is a page plus its published descendants;
+an unpublished page hides everything below it, as in the navigation.
+
+PAGE_SUBTREE_STRATEGY picks how descendants are found:
+
+- ``cte``: one recursive CTE over ``parent_id``, embedded as a subquery.
+- ``path``: the stored ``Page.path`` (``/<root id>/<child id>/``) and a
+  prefix match, for SQLite builds without recursive CTEs. Run
+  ``manage.py rebuild_page_paths`` once before switching to it.
+"""
+import uuid
+
+from django.conf import settings
+from django.db import connections
+from django.db.models.expressions import RawSQL
+
+from .models import Page
+
+# stops the recursion if a parent cycle ever slips in
+MAX_DEPTH = 50
+
+
+def page_path(page):
+    parent_path = '/'
+    if page.parent_id:
+        # read from the database; a cached parent instance may be stale
+        parent_path = Page.objects.filter(pk=page.parent_id).values_list('path', flat=True).first() or '/'
+    return f"{parent_path}{page.pk.hex}/"
+
+
+def subtree_cte(page, using='default'):
+    """``RawSQL`` selecting the ids of ``page`` and its published descendants."""
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    table, pk = qn(Page._meta.db_table), qn(Page._meta.pk.column)
+    sql = f"""
+        WITH RECURSIVE subtree (id, depth) AS (
+            SELECT {pk}, 0 FROM {table} WHERE {pk} = %s
+            UNION ALL
+            SELECT child.{pk}, subtree.depth + 1
+            FROM {table} child JOIN subtree ON child.{qn('parent_id')} = subtree.id
+            WHERE child.{qn('is_published')} = %s AND subtree.depth < %s
+        )
+        SELECT id FROM subtree"""
+    pk_value = Page._meta.pk.get_db_prep_value(page.pk, connection)
+    return RawSQL(sql, (pk_value, True, MAX_DEPTH))
+
+
+def subtree_from_path(page, using='default'):
+    """Ids of ``page`` and its published descendants, read by path prefix."""
+    rows = (Page.objects.using(using).filter(path__startswith=page.path)
+            .values_list('id', 'path', 'is_published'))
+    included = {page.pk}
+    # parents sort before their children
+    for pk, path, is_published in sorted(rows, key=lambda row: len(row[1])):
+        segments = path.strip('/').split('/')
+        if is_published and len(segments) > 1 and uuid.UUID(segments[-2]) in included:
+            included.add(pk)
+    return list(included)
+
+
+def subtree_page_ids(page, using='default'):
+    if settings.PAGE_SUBTREE_STRATEGY == 'path' and page.path:
+        return subtree_from_path(page, using)
+    return subtree_cte(page, using)
@@ -1,17 +1,62 @@
 # rest/views.py
+import hmac
+
 from rest_framework import viewsets
 from rest_framework import generics
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
 from rest_framework.viewsets import ReadOnlyModelViewSet
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
-from .models import Page, Tag, Content, ContentImage, ContentText, VideoUrl
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.views.static import serve
+from .metrics import collector
+from .storage import IMMUTABLE_CACHE_CONTROL, is_hashed_name
+from .tag_index import tag_index, to_bitmap, from_bitmap
+from .tree import subtree_page_ids
+from .models import Page, Tag, Content, ContentImage, ContentText, VideoUrl, RelatedContent
+from .related import score_offset
 from .serializers import (
     ContentListSerializer, PageSerializer, TagSerializer, ContentSerializer,
-    ContentImageSerializer, ContentTextSerializer, PageNavigationSerializer, VideoSerializer
+    ContentImageSerializer, ContentTextSerializer, PageNavigationSerializer, VideoSerializer,
+    RelatedContentSerializer
 )
 
 
+def parse_tag_filter(params):
+    """
+    Slugs and operator from ?tag=<slug> or ?tags=<slug>,<slug>&tags_op=and|or
+    (default ``or``); None when no tag filter is requested.
+    """
+    slugs = [slug for slug in params.get('tags', '').split(',') if slug]
+    if params.get('tag'):
+        slugs.append(params['tag'])
+    if not slugs:
+        return None
+    operator = 'and' if params.get('tags_op', 'or').lower() == 'and' else 'or'
+    return slugs, operator
+
+
+def filter_by_tags(queryset, tag_filter):
+    """
+    Contents of ``queryset`` matching a ``parse_tag_filter()`` result. Matches
+    from the tag index go into SQL as an id list up to TAG_FILTER_MAX_IDS;
+    past that an indexed subquery on the M2M table per tag is cheaper.
+    """
+    slugs, operator = tag_filter
+    bitmap = tag_index.match(slugs, operator)
+    if bitmap.bit_count() <= settings.TAG_FILTER_MAX_IDS:
+        return queryset.filter(id__in=from_bitmap(bitmap))
+    tagged = Content.tags.through.objects
+    if operator == 'or':
+        return queryset.filter(id__in=tagged.filter(tag__slug__in=slugs).values('content_id'))
+    for slug in slugs:
+        queryset = queryset.filter(id__in=tagged.filter(tag__slug=slug).values('content_id'))
+    return queryset
+
+
 class ReadOnlyOrAdminPermission(IsAuthenticatedOrReadOnly):
     def has_permission(self, request, view):
         if request.method in ('GET', 'HEAD', 'OPTIONS'):
@@ -45,8 +90,28 @@ class PageViewSet(viewsets.ModelViewSet):
     ordering = ['title']
 
     def get_queryset(self):
+        if self.action == 'subtree':
+            return Page.objects.only('id', 'path')
         return Page.objects.prefetch_related('contents__tags', 'contents__images', 'contents__texts', 'children')
 
+    @action(detail=True)
+    def subtree(self, request, pk=None):
+        """
+        Paginated contents of this page and all its published descendants,
+        filterable like /api/contents/ (?tag=, ?tags=&tags_op=). Descendants
+        are resolved in the database, so the query count does not depend on
+        the depth of the tree.
+        """
+        page = self.get_object()
+        queryset = (Content.objects.filter(page_id__in=subtree_page_ids(page, page._state.db))
+                    .prefetch_related('tags', 'images').order_by('title', 'id'))
+        tag_filter = parse_tag_filter(request.query_params)
+        if tag_filter:
+            queryset = filter_by_tags(queryset, tag_filter)
+        contents = self.paginate_queryset(queryset)
+        serializer = ContentListSerializer(contents, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
+
 
 # Rest of the viewsets (unchanged)
 class TagViewSet(viewsets.ModelViewSet):
@@ -67,13 +132,18 @@ class ContentViewSet(viewsets.ModelViewSet):
     search_fields = ['title']  # Disable ?search=
     ordering_fields = ['title', 'page', 'created_at']
     ordering = ['title']
+    # Query params resolved from the tag index rather than by the filter backends
+    tag_params = {'tag', 'tags', 'tags_op', 'page', 'ordering', 'format'}
+
+    def get_tag_filter(self):
+        return parse_tag_filter(self.request.query_params)
 
     def get_queryset(self):
         queryset = Content.objects.select_related(
             'page').prefetch_related('tags', 'images', 'texts')
-        tag_slug = self.request.query_params.get('tag')
-        if tag_slug:
-            queryset = queryset.filter(tags__slug=tag_slug)
+        tag_filter = self.get_tag_filter()
+        if tag_filter:
+            queryset = filter_by_tags(queryset, tag_filter)
         return queryset
 
     def get_serializer_class(self):
@@ -81,6 +151,39 @@ class ContentViewSet(viewsets.ModelViewSet):
             return ContentListSerializer
         return ContentSerializer
 
+    @action(detail=False)
+    def facets(self, request):
+        """
+        Content count per tag for the current filter set. Tag-only filters are
+        answered from the tag index; other filters (e.g. ?search=) cost a
+        single id query.
+        """
+        tag_filter = self.get_tag_filter()
+        within = tag_index.match(*tag_filter) if tag_filter else None
+        if set(request.query_params) - self.tag_params:
+            queryset = self.filter_queryset(self.get_queryset())
+            ids = queryset.prefetch_related(None).order_by().values_list('id', flat=True)
+            within = to_bitmap(ids)
+        facets = tag_index.facets(within)
+        count = within.bit_count() if within is not None else Content.objects.count()
+        return Response({'count': count, 'tags': facets})
+
+    @action(detail=True)
+    def related(self, request, pk=None):
+        """
+        Up to RELATED_CONTENT_TOP_K related contents, best first, read from the
+        precomputed RelatedContent table in one query (no get_object()).
+        """
+        try:
+            content_id = int(pk)
+        except ValueError:
+            raise Http404
+        entries = (RelatedContent.objects.filter(content_id=content_id)
+                   .select_related('related').order_by('rank'))
+        serializer = RelatedContentSerializer(entries, many=True,
+                                              context={'request': request, 'score_offset': score_offset()})
+        return Response(serializer.data)
+
 
 class ContentImageViewSet(viewsets.ModelViewSet):
     queryset = ContentImage.objects.all()
@@ -112,3 +215,24 @@ class CarouselContentListView(generics.ListAPIView):
 class VideoViewSet(ReadOnlyModelViewSet):
     queryset = VideoUrl.objects.all()
     serializer_class = VideoSerializer
+
+
+def metrics_view(request):
+    """Prometheus text exposition of the ServerTimingMiddleware histograms."""
+    allowed = request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+    if settings.METRICS_TOKEN:
+        expected = f'Bearer {settings.METRICS_TOKEN}'
+        allowed = allowed or hmac.compare_digest(
+            request.META.get('HTTP_AUTHORIZATION', '').encode(), expected.encode())
+    if not (allowed or request.user.is_staff):
+        return HttpResponseForbidden()
+    return HttpResponse(collector.render(),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def serve_media(request, path, document_root=None, show_indexes=False):
+    """django.views.static.serve, with content-hashed files cacheable forever."""
+    response = serve(request, path, document_root, show_indexes)
+    if response.status_code == 200 and is_hashed_name(path):
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response